@@ -2,6 +2,8 @@ from flask import Flask, request, jsonify
 from flask_migrate import Migrate
 from common.models import db, User
 from common.config import Config
+from common.profiling import Profiling
+from common.admission import AdmissionControl, json_field
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 from flask_cors import CORS
 from tenacity import retry, stop_after_attempt, wait_fixed
@@ -20,6 +22,8 @@ CORS(app, resources={r"/*": {"origins": "*", "supports_credentials": True}})
 
 db.init_app(app)
 jwt = JWTManager(app)
+profiling = Profiling(app, url_prefix='/auth')
+admission = AdmissionControl(app)
 migrate = Migrate(app, db)
 
 metrics = PrometheusMetrics(app)
@@ -45,6 +49,7 @@ def root_index():
     return "OK", 200
 
 @app.route('/auth/register', methods=['POST'])
+@admission.limit('register', rate=5, per=60, by=('ip',), concurrency=4)
 def register_user():
     try:
         data = request.get_json()
@@ -70,6 +75,13 @@ def register_user():
         return jsonify({'message': 'Internal server error'}), 500
 
 @app.route('/auth/login', methods=['POST'])
+# Every attempt costs a password hash; limit per client and per account.
+# The per-account limit is what slows down guessing spread over many
+# addresses, but anyone can use it up for an account they know the name of
+# (including admin), so it is kept ten times looser than the per-client one:
+# locking an account out takes ten addresses flooding at their own limit.
+@admission.limit('login', rate=10, per=60, by=('ip',), concurrency=4)
+@admission.limit('login_account', rate=100, per=60, by=(('username', json_field('username')),))
 def login_user():
     try:
         data = request.get_json()
@@ -0,0 +1,167 @@
+"""Show that cheap endpoints stay fast while one client floods expensive ones.
+
+    cd backend
+    python -m benchmarks.admission --duration 10
+
+All three services run in-process. Well-behaved clients keep listing
+cases, opening cases and downloading scripts while measuring latency, in
+three phases:
+
+- quiet:              no abusive traffic
+- flood_unprotected:  an abusive client hammers login, upload and the admin
+                      case listing with admission control switched off
+- flood_protected:    the same flood with admission control on
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from benchmarks.harness import load_services
+from benchmarks.seed import BENCHMARK_PASSWORD, build_report, seed_database
+from benchmarks.workloads import issue_tokens, percentile
+from common.admission import RedisBackend, backend_from_uri
+
+ABUSER_IP = '203.0.113.7'
+
+
+def _victim(services, ctx, index, stop, samples):
+    rng = random.Random(index)
+    env = {'REMOTE_ADDR': f'198.51.100.{index + 1}'}
+    case_client = services['case_service'].app.test_client()
+    diagnostic_client = services['diagnostic_service'].app.test_client()
+    while not stop.is_set():
+        case_id, owner_id = rng.choice(ctx['cases'])
+        headers = {'Authorization': f"Bearer {ctx['tokens'][owner_id]}"}
+        route = rng.choice(['list_cases', 'get_case', 'download_script'])
+        start = time.perf_counter()
+        if route == 'list_cases':
+            response = case_client.get('/case/cases', headers=headers, environ_base=env)
+        elif route == 'get_case':
+            response = case_client.get(f'/case/cases/{case_id}', headers=headers, environ_base=env)
+        else:
+            response = diagnostic_client.get(f'/diagnostic/download_script/{case_id}', headers=headers,
+                                             environ_base=env)
+        samples.append((route, time.perf_counter() - start, response.status_code))
+
+
+def _abuser(services, ctx, index, stop, statuses, rate):
+    rng = random.Random(1000 + index)
+    bodies = [json.dumps(build_report(rng, 'large')).encode() for _ in range(5)]
+    env = {'REMOTE_ADDR': ABUSER_IP}
+    headers = {'Authorization': f"Bearer {ctx['admin_token']}"}
+    auth_client = services['auth_service'].app.test_client()
+    case_client = services['case_service'].app.test_client()
+    diagnostic_client = services['diagnostic_service'].app.test_client()
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        # Send at a fixed rate whatever the response; the rate is capped only so
+        # the client side of the flood doesn't eat the CPU of this one process
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        route = rng.choice(['login', 'upload', 'admin_cases'])
+        if route == 'login':
+            response = auth_client.post('/auth/login', environ_base=env,
+                                        json={'username': 'user00000', 'password': BENCHMARK_PASSWORD})
+        elif route == 'upload':
+            body = rng.choice(bodies)
+            response = diagnostic_client.post(f'/diagnostic/upload/{rng.choice(ctx["cases"])[0]}',
+                                              headers=headers, environ_base=env,
+                                              data={'file': (io.BytesIO(body), 'results.json')},
+                                              content_type='multipart/form-data')
+        else:
+            response = case_client.get('/case/admin/cases', headers=headers, environ_base=env)
+        statuses[f'{route} {response.status_code}'] += 1
+
+
+def run_phase(services, ctx, duration, victims, abusers, abuser_rate):
+    stop = threading.Event()
+    samples = []
+    statuses = Counter()
+    threads = [threading.Thread(target=_victim, args=(services, ctx, i, stop, samples)) for i in range(victims)]
+    threads += [threading.Thread(target=_abuser, args=(services, ctx, i, stop, statuses, abuser_rate))
+                for i in range(abusers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(s[1] * 1000.0 for s in samples)
+    return {
+        'victim_requests': len(samples),
+        'victim_errors': sum(1 for s in samples if s[2] >= 400),
+        'victim_latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+        },
+        'abuser_responses': dict(sorted(statuses.items())),
+    }
+
+
+def set_admission(services, enabled, backend_uri):
+    # A fresh backend per phase so no limits carry over
+    prefix = f'admission:bench-{uuid.uuid4().hex}:'
+    for module in services.values():
+        module.admission.enabled = enabled
+        module.admission.backend = backend_from_uri(backend_uri)
+        if isinstance(module.admission.backend, RedisBackend):
+            module.admission.backend.prefix = prefix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test admission control.')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--victims', type=int, default=2)
+    parser.add_argument('--abusers', type=int, default=8)
+    parser.add_argument('--abuser-rate', type=float, default=25.0, help='Requests per second per abusive thread')
+    parser.add_argument('--admission-backend', default='memory', help='memory or a redis:// URL')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='admission_results.json')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='itdiag-admission-')
+    try:
+        services = load_services(f"sqlite:///{os.path.join(workdir, 'bench.db')}", os.path.join(workdir, 'uploads'),
+                                 admission=True, admission_backend=args.admission_backend)
+        logging.getLogger().setLevel(logging.ERROR)
+        ctx = issue_tokens(services, seed_database(services['auth_service'].app, 'small', args.seed))
+
+        phases = {}
+        for phase, abusers, enabled in [('quiet', 0, True), ('flood_unprotected', args.abusers, False),
+                                        ('flood_protected', args.abusers, True)]:
+            set_admission(services, enabled, args.admission_backend)
+            phases[phase] = run_phase(services, ctx, args.duration, args.victims, abusers, args.abuser_rate)
+            latency = phases[phase]['victim_latency_ms']
+            print(f"{phase:18} victim p50 {latency['p50']:>8} ms  p95 {latency['p95']:>8} ms  "
+                  f"p99 {latency['p99']:>8} ms  ({phases[phase]['victim_requests']} requests)", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'meta': {'duration': args.duration, 'victims': args.victims, 'abusers': args.abusers,
+                 'abuser_rate': args.abuser_rate,
+                 'admission_backend': args.admission_backend.split(':', 1)[0], 'seed': args.seed},
+        'phases': phases,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
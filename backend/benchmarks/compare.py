@@ -0,0 +1,61 @@
+"""Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+
+
+def _delta(old, new):
+    if not old or new is None:
+        return '    n/a'
+    return f'{(new - old) / old * 100:+6.1f}%'
+
+
+def _error_delta(old, new):
+    if old is None:
+        return '    n/a'
+    return f'{new - old:+7d}'
+
+
+def compare(baseline, candidate):
+    lines = [f"{'workload':16} {'req/s':>10} {'Δ':>8} {'p95 ms':>10} {'Δ':>8} {'queries':>8} {'Δ':>8} "
+             f"{'errors':>7} {'Δ':>7}"]
+    failing = []
+    for name, new in candidate['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            lines.append(f'{name:16} (not in baseline)')
+            continue
+        lines.append(
+            f"{name:16} {new['throughput_rps']:>10} {_delta(old['throughput_rps'], new['throughput_rps']):>8} "
+            f"{new['latency_ms']['p95']:>10} {_delta(old['latency_ms']['p95'], new['latency_ms']['p95']):>8} "
+            f"{new['queries_per_request']['mean']:>8} "
+            f"{_delta(old['queries_per_request']['mean'], new['queries_per_request']['mean']):>8} "
+            f"{new['errors']:>7} {_error_delta(old.get('errors'), new['errors']):>7}"
+            + ('  !' if new['errors'] else '')
+        )
+        if new['errors']:
+            failing.append(name)
+    if failing:
+        # Failed requests are cheap, so errors can pass for a throughput gain
+        lines.append(f"! requests failed in: {', '.join(failing)}; their timings are not comparable")
+    lines.append(f"peak RSS: {baseline.get('peak_rss_kb')} kB -> {candidate.get('peak_rss_kb')} kB")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(compare(baseline, candidate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import sys
+import threading
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ('auth_service', 'case_service', 'diagnostic_service')
+
+_query_counter = threading.local()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+
+
+def reset_query_count():
+    _query_counter.count = 0
+
+
+def query_count():
+    return getattr(_query_counter, 'count', 0)
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def reset_peak_rss():
+    """Start a new peak RSS window; returns False where that isn't possible.
+
+    ru_maxrss only ever goes up over the life of the process, so per-phase
+    peaks need Linux, where writing 5 to clear_refs resets VmHWM.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def window_peak_rss_kb():
+    """Peak RSS since the last successful reset_peak_rss()."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return None
+
+
+def reset_database(database_uri):
+    # Drop everything so a run always starts from the same empty schema
+    from common.models import db
+
+    scratch = Flask('benchmark_reset')
+    scratch.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    scratch.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(scratch)
+    with scratch.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+def _load_service(name):
+    import prometheus_client
+
+    # Every service registers the same metric names; in production each one
+    # lives in its own process, so give each its own registry here.
+    default_registry = prometheus_client.REGISTRY
+    prometheus_client.REGISTRY = prometheus_client.CollectorRegistry()
+    try:
+        module_name = f'{name}_app'
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(BACKEND_DIR, name, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    finally:
+        prometheus_client.REGISTRY = default_registry
+    return module
+
+
+def load_services(database_uri, upload_folder, admission=False, admission_backend='memory'):
+    """Import the three Flask apps in-process against a shared database.
+
+    Configuration is read from the environment at import time, exactly as it
+    is inside the containers, so it has to be set before loading. Rate limits
+    are off unless `admission` is set, since every benchmark request comes
+    from the same client.
+    """
+    os.environ['DATABASE_URI'] = database_uri
+    os.environ['UPLOAD_FOLDER'] = upload_folder
+    os.environ['ADMISSION_ENABLED'] = 'true' if admission else 'false'
+    os.environ['ADMISSION_BACKEND'] = admission_backend
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    reset_database(database_uri)
+    return {name: _load_service(name) for name in SERVICES}
@@ -0,0 +1,151 @@
+"""Benchmark incremental re-analysis over a large number of stored reports.
+
+    cd backend
+    python -m benchmarks.reanalysis --cases 1000000 --workers 4
+
+Seeds `--cases` analysed cases without rule version state, then measures:
+
+- initial:     every case is stale and fully re-analysed
+- up_to_date:  nothing changed, so the run only has to find that out
+- one_rule:    one section's rule is made stricter and its version bumped
+- resume:      another rule changed, interrupted half-way and resumed
+
+The changed rules flag more reports and word their suggestions differently,
+so the bump phases also pay for rewriting the affected cases.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import load_services, reset_peak_rss, window_peak_rss_kb
+from benchmarks.seed import build_report, report_size_for
+from common.analysis import RULE_VERSIONS, RULES, RULESET_VERSION, analyze_data, summarize
+from common.models import db, Case, User
+from common.reanalysis import reanalyze_cases
+
+
+def _stricter_network_connections(data):
+    # Only SSH is expected; web ports are reported too
+    if any('tcp' in line and ':22 ' not in line for line in data.get('network_connections', [])):
+        return ['Network Connections: services other than SSH are listening.',
+                'Review every listening service and close the ones that are not needed.']
+
+
+def _stricter_ping_test(data):
+    loss = RULES_BEFORE_CHANGES['ping_test'](data)
+    if loss:
+        return ['Ping Test: packet loss detected.'] + loss[1:]
+
+
+RULES_BEFORE_CHANGES = dict(RULES)
+CHANGED_RULES = {'network_connections': _stricter_network_connections, 'ping_test': _stricter_ping_test}
+# Analysis workers are spawned and import this module afresh, so the changed
+# rules are handed to them through the environment
+CHANGED_RULES_ENV = 'REANALYSIS_BENCHMARK_CHANGED_RULES'
+
+
+def change_rule(section):
+    RULES[section] = CHANGED_RULES[section]
+    changed = [s for s in os.environ.get(CHANGED_RULES_ENV, '').split(',') if s]
+    os.environ[CHANGED_RULES_ENV] = ','.join(changed + [section])
+
+
+for _section in filter(None, os.environ.get(CHANGED_RULES_ENV, '').split(',')):
+    RULES[_section] = CHANGED_RULES[_section]
+
+
+def seed_cases(app, count, seed, batch=10000):
+    rng = random.Random(seed)
+    # A few hundred distinct reports are enough to exercise every rule
+    reports = [build_report(rng, report_size_for(i)) for i in range(500)]
+    with app.app_context():
+        owner_id = db.session.query(User.id).order_by(User.id).first()[0]
+        for start in range(0, count, batch):
+            rows = []
+            for i in range(start, min(start + batch, count)):
+                report = reports[i % len(reports)]
+                suggestions = analyze_data(report)
+                rows.append({'description': f'Case {i}', 'platform': 'linux', 'user_id': owner_id,
+                             'analysis': summarize(suggestions), 'analysis_data': report, 'suggestions': suggestions})
+            db.session.bulk_insert_mappings(Case, rows)
+            db.session.commit()
+
+
+def timed_run(app, label, rule_versions, ruleset_version, args, limit=None):
+    measure_rss = reset_peak_rss()
+    with app.app_context():
+        start = time.perf_counter()
+        progress = reanalyze_cases(chunk_size=args.chunk_size, workers=args.workers, limit=limit,
+                                   rule_versions=rule_versions, ruleset_version=ruleset_version)
+        elapsed = time.perf_counter() - start
+    result = {
+        'scanned': progress['scanned'],
+        'updated': progress['updated'],
+        'seconds': round(elapsed, 3),
+        'cases_per_second': round(progress['scanned'] / elapsed, 1) if progress['scanned'] else None,
+        'peak_rss_kb': window_peak_rss_kb() if measure_rss else None,
+    }
+    print(f"{label:12} scanned {result['scanned']:>8}  updated {result['updated']:>8}  {result['seconds']:>9}s",
+          file=sys.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark incremental re-analysis.')
+    parser.add_argument('--database-uri', help='SQLAlchemy URI of a dedicated database (default: temporary SQLite)')
+    parser.add_argument('--cases', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='reanalysis_results.json')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='itdiag-reanalysis-')
+    try:
+        database_uri = args.database_uri or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        services = load_services(database_uri, os.path.join(workdir, 'uploads'))
+        logging.getLogger().setLevel(logging.WARNING)
+        app = services['diagnostic_service'].app
+
+        start = time.perf_counter()
+        seed_cases(app, args.cases, args.seed)
+        print(f'Seeded {args.cases} cases in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+        versions, ruleset = dict(RULE_VERSIONS), RULESET_VERSION
+        phases = {
+            'initial': timed_run(app, 'initial', versions, ruleset, args),
+            'up_to_date': timed_run(app, 'up_to_date', versions, ruleset, args),
+        }
+        change_rule('network_connections')
+        versions['network_connections'] += 1
+        ruleset += 1
+        phases['one_rule'] = timed_run(app, 'one_rule', versions, ruleset, args)
+        change_rule('ping_test')
+        versions['ping_test'] += 1
+        ruleset += 1
+        phases['resume_first_half'] = timed_run(app, 'resume 1/2', versions, ruleset, args, limit=args.cases // 2)
+        phases['resume_second_half'] = timed_run(app, 'resume 2/2', versions, ruleset, args)
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        # A million-case SQLite file runs to gigabytes
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'meta': {'cases': args.cases, 'chunk_size': args.chunk_size, 'workers': args.workers,
+                 'database': database_uri.split(':', 1)[0], 'seed': args.seed},
+        'phases': phases,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
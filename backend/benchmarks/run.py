@@ -0,0 +1,92 @@
+"""Run the backend benchmark suite and write the results to a JSON file.
+
+    cd backend
+    python -m benchmarks.run --scale small --output bench_results.json
+
+By default the services run against a throwaway SQLite database. Pass
+--database-uri to use a local Postgres instead; every table in that database
+is dropped before seeding.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import BACKEND_DIR, load_services, peak_rss_kb
+from benchmarks.seed import SCALES, seed_database
+from benchmarks.workloads import WORKLOADS, issue_tokens, run_workload
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(database_uri, scale, seed, requests, concurrency, only):
+    workdir = tempfile.mkdtemp(prefix='itdiag-bench-')
+    database_uri = database_uri or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    services = load_services(database_uri, os.path.join(workdir, 'uploads'))
+    # The services log at DEBUG; keep that out of the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    seeded = seed_database(services['auth_service'].app, scale, seed)
+    seed_seconds = time.perf_counter() - start
+    ctx = issue_tokens(services, seeded)
+    # Read before the workloads start resetting the peak (see reset_peak_rss)
+    peaks = [peak_rss_kb()]
+
+    requests = requests or SCALES[scale]['requests']
+    scenarios = {}
+    for workload in WORKLOADS:
+        if only and workload.name not in only:
+            continue
+        scenarios[workload.name] = run_workload(workload, services, ctx, requests, seed, concurrency)
+        print(f"{workload.name:16} {scenarios[workload.name]['throughput_rps']:>10} req/s  "
+              f"p95 {scenarios[workload.name]['latency_ms']['p95']:>9} ms", file=sys.stderr)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'database': database_uri.split(':', 1)[0],
+            'scale': scale,
+            'seed': seed,
+            'requests': requests,
+            'concurrency': concurrency,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'dataset': dict(seeded['counts'], seed_seconds=round(seed_seconds, 3)),
+        'scenarios': scenarios,
+        'peak_rss_kb': max(filter(None, peaks + [peak_rss_kb()] + [s['peak_rss_kb'] for s in scenarios.values()]),
+                           default=None),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the backend services in-process.')
+    parser.add_argument('--database-uri', help='SQLAlchemy URI of a dedicated database (default: temporary SQLite)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--requests', type=int, help='Request budget per workload (default depends on --scale)')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help='Run only the named workloads')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args(argv)
+
+    results = run(args.database_uri, args.scale, args.seed, args.requests, args.concurrency, args.only)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
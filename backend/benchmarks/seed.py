@@ -0,0 +1,115 @@
+import json
+import random
+
+from werkzeug.security import generate_password_hash
+
+from common.models import db, User, Case, CaseComment
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# Lines per section for small / medium / large diagnostic reports
+REPORT_SIZES = {'small': 5, 'medium': 50, 'large': 500}
+
+SCALES = {
+    'small': {'users': 20, 'cases_per_user': 5, 'comments_per_case': 5, 'requests': 200},
+    'medium': {'users': 200, 'cases_per_user': 10, 'comments_per_case': 10, 'requests': 500},
+    'large': {'users': 1000, 'cases_per_user': 20, 'comments_per_case': 20, 'requests': 1000},
+}
+
+
+def build_report(rng, size):
+    """Build a diagnostic report shaped like the output of the generated script."""
+    lines = REPORT_SIZES[size]
+    loss = rng.choice([0, 0, 0, 25, 100])
+    report = {
+        'ping_test': [f'64 bytes from 142.250.0.{i}: icmp_seq={i} ttl=117 time={rng.uniform(5, 80):.1f} ms'
+                      for i in range(lines)] +
+                     [f'4 packets transmitted, {4 - loss // 25} received, {loss}% packet loss, time 3004ms'],
+        'dns_resolution': ['Server:\t\t127.0.0.53', 'Address:\t127.0.0.53#53'] +
+                          (["** server can't find google.com: SERVFAIL"] if rng.random() < 0.2 else
+                           ['Name:\tgoogle.com', 'Address: 142.250.0.1']),
+        'tracepath': [f' {i}:  10.0.{i}.1  {rng.uniform(1, 40):.3f}ms' for i in range(1, lines + 1)] +
+                     (['no reply', 'Too many hops: pmtu 1500 unreachable'] if rng.random() < 0.2 else []),
+        'network_connections': [f'tcp   LISTEN 0      128    0.0.0.0:{rng.choice([22, 80, 443, 5432, 8080])} 0.0.0.0:*'
+                                for _ in range(lines)],
+        'pending_updates': [f'package-{i}/stable 1.0.{i} amd64 [upgradable]' for i in range(rng.randint(0, lines))],
+        'swap_usage': [f'Swap: 2047 {rng.choice([0, 0, 512])} 1535'],
+        'cpu_usage': [f'%Cpu(s): {rng.uniform(0, 100):.1f} us, 1.0 sy, 0.0 ni, 90.0 id' for _ in range(lines)],
+        'memory_usage': [f'Mem: 7982 {rng.randint(500, 7900)} 1200 12 2300 6400' for _ in range(lines)],
+        'load_average': [f'{rng.uniform(0, 4):.2f} {rng.uniform(0, 4):.2f} {rng.uniform(0, 4):.2f} 1/523 4242'],
+        'vpn_status': [] if rng.random() < 0.3 else ['openvpn.service active (running)'],
+    }
+    return report
+
+
+def report_size_for(index):
+    # Mostly small reports with a long tail of large ones
+    if index % 20 == 0:
+        return 'large'
+    if index % 4 == 0:
+        return 'medium'
+    return 'small'
+
+
+def seed_database(app, scale, seed):
+    """Insert a deterministic data set and return the ids the workloads need."""
+    rng = random.Random(seed)
+    params = SCALES[scale]
+    # One hash is valid for every user and avoids paying the hashing cost per row
+    password_hash = generate_password_hash(BENCHMARK_PASSWORD)
+
+    with app.app_context():
+        db.session.bulk_insert_mappings(User, [
+            {'username': f'user{i:05d}', 'password_hash': password_hash, 'is_admin': False}
+            for i in range(params['users'])
+        ])
+        db.session.commit()
+        users = [u for u, in db.session.query(User.id).filter(User.is_admin.is_(False)).order_by(User.id)]
+        # The auth service creates the default admin on first start
+        admin_id = db.session.query(User.id).filter(User.is_admin.is_(True)).order_by(User.id).first()[0]
+
+        case_rows = []
+        for user_id in users:
+            for _ in range(params['cases_per_user']):
+                index = len(case_rows)
+                row = {
+                    'description': f'Case {index}: intermittent connectivity on host {rng.randint(1, 254)}',
+                    'platform': 'linux',
+                    'user_id': user_id,
+                }
+                # Three quarters of the cases already went through an upload
+                if index % 4:
+                    report = build_report(rng, report_size_for(index))
+                    row['analysis'] = 'Analysis completed. See suggestions below if any.'
+                    row['analysis_data'] = report
+                    row['suggestions'] = {section: ['Seeded suggestion.'] for section in report if report[section]}
+                case_rows.append(row)
+        db.session.bulk_insert_mappings(Case, case_rows)
+        db.session.commit()
+        cases = [(c, u) for c, u in db.session.query(Case.id, Case.user_id).order_by(Case.id)]
+
+        comment_rows = []
+        for case_id, owner_id in cases:
+            for n in range(params['comments_per_case']):
+                comment_rows.append({
+                    'case_id': case_id,
+                    'user_id': owner_id if n % 3 else admin_id,
+                    'comment': ' '.join(rng.choice(['checked', 'gateway', 'restarted', 'dns', 'link', 'still', 'failing'])
+                                        for _ in range(rng.randint(3, 40))),
+                })
+        for start in range(0, len(comment_rows), 10000):
+            db.session.bulk_insert_mappings(CaseComment, comment_rows[start:start + 10000])
+        db.session.commit()
+
+    report_bytes = sum(len(json.dumps(r['analysis_data'])) for r in case_rows if 'analysis_data' in r)
+    return {
+        'users': users,
+        'cases': cases,
+        'admin_id': admin_id,
+        'counts': {
+            'users': len(users),
+            'cases': len(cases),
+            'comments': len(comment_rows),
+            'report_bytes': report_bytes,
+        },
+    }
@@ -0,0 +1,222 @@
+"""Compare the threaded and ASGI serving modes under many concurrent clients.
+
+    cd backend
+    python -m benchmarks.serving --service case --clients 2000 --duration 20
+
+The service runs in a subprocess exactly as it would in its container
+(`python app.py`-style threaded server, or uvicorn with `asgi:application`)
+against a seeded SQLite file. Each client opens a connection, sends one
+request and reads the response, cycling through its own fixed plan until the
+duration is over.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.harness import BACKEND_DIR, load_services
+from benchmarks.seed import build_report, seed_database
+from benchmarks.workloads import issue_tokens, percentile
+
+SERVER = {
+    'threaded': 'import sys; from app import app; app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)',
+    'asgi': ('import sys, uvicorn; uvicorn.run("asgi:application", host="127.0.0.1", port=int(sys.argv[1]), '
+             'backlog=4096, timeout_graceful_shutdown=5, log_level="warning")'),
+}
+
+# (route label, weight, builder) per service; builders return (method, path, headers, body)
+ROUTES = {
+    'case': [
+        ('list_cases', 40, lambda ctx, rng: ('GET', '/case/cases', _owner_token(ctx, rng), None)),
+        ('get_case', 40, lambda ctx, rng: ('GET', f'/case/cases/{rng.choice(ctx["cases"])[0]}',
+                                           ctx['admin_auth'], None)),
+        ('admin_cases', 2, lambda ctx, rng: ('GET', '/case/admin/cases', ctx['admin_auth'], None)),
+    ],
+    'diagnostic': [
+        ('download_script', 80, lambda ctx, rng: ('GET', f'/diagnostic/download_script/{rng.choice(ctx["cases"])[0]}',
+                                                  ctx['admin_auth'], None)),
+        ('upload', 20, lambda ctx, rng: _upload(ctx, rng)),
+    ],
+}
+
+
+def _owner_token(ctx, rng):
+    return {'Authorization': f"Bearer {ctx['tokens'][rng.choice(ctx['users'])]}"}
+
+
+def _upload(ctx, rng):
+    boundary = 'benchmarkboundary'
+    report = json.dumps(build_report(rng, rng.choice(['small', 'small', 'medium']))).encode()
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="results.json"\r\n'
+            f'Content-Type: application/json\r\n\r\n').encode() + report + f'\r\n--{boundary}--\r\n'.encode()
+    headers = dict(ctx['admin_auth'], **{'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    return 'POST', f'/diagnostic/upload/{rng.choice(ctx["cases"])[0]}', headers, body
+
+
+def _proc_stats(pid):
+    # Threads and open file descriptors (sockets, DB files) of the server
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            threads = next(int(line.split()[1]) for line in f if line.startswith('Threads:'))
+        return threads, len(os.listdir(f'/proc/{pid}/fd'))
+    except OSError:
+        return None, None
+
+
+async def _request(port, method, path, headers, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        lines = [f'{method} {path} HTTP/1.1', f'Host: 127.0.0.1:{port}', 'Connection: close']
+        lines += [f'{k}: {v}' for k, v in headers.items()]
+        if body is not None:
+            lines.append(f'Content-Length: {len(body)}')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + (body or b''))
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _client(port, plan, deadline, samples):
+    for route, method, path, headers, body in itertools.cycle(plan):
+        if time.monotonic() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(_request(port, method, path, headers, body), timeout=60)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            status = None
+        samples.append((route, time.perf_counter() - start, status))
+
+
+async def _drive(port, pid, plans, duration):
+    samples = []
+    peaks = {'threads': 0, 'fds': 0}
+    deadline = time.monotonic() + duration
+
+    async def monitor():
+        while time.monotonic() < deadline:
+            threads, fds = _proc_stats(pid)
+            if threads is not None:
+                peaks['threads'] = max(peaks['threads'], threads)
+                peaks['fds'] = max(peaks['fds'], fds)
+            await asyncio.sleep(0.1)
+
+    start = time.perf_counter()
+    await asyncio.gather(monitor(), *(_client(port, plan, deadline, samples) for plan in plans))
+    return samples, time.perf_counter() - start, peaks
+
+
+def _summarize(samples, wall, peaks):
+    routes = {}
+    for route in sorted({s[0] for s in samples}):
+        ok = sorted(s[1] * 1000.0 for s in samples if s[0] == route and s[2] is not None and s[2] < 500)
+        routes[route] = {
+            'completed': len(ok),
+            'failed': sum(1 for s in samples if s[0] == route and (s[2] is None or s[2] >= 500)),
+            'p50_ms': round(percentile(ok, 50), 2) if ok else None,
+            'p95_ms': round(percentile(ok, 95), 2) if ok else None,
+            'p99_ms': round(percentile(ok, 99), 2) if ok else None,
+        }
+    completed = sum(r['completed'] for r in routes.values())
+    return {
+        'completed': completed,
+        'failed': sum(r['failed'] for r in routes.values()),
+        'requests_per_second': round(completed / wall, 2),
+        'peak_server_threads': peaks['threads'],
+        'peak_server_open_fds': peaks['fds'],
+        'routes': routes,
+    }
+
+
+def _wait_until_up(port, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not come up')
+
+
+def run_mode(mode, service, env, port, plans, duration):
+    proc = subprocess.Popen([sys.executable, '-c', SERVER[mode], str(port)],
+                            cwd=os.path.join(BACKEND_DIR, f'{service}_service'), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_up(port, proc)
+        samples, wall, peaks = asyncio.run(_drive(port, proc.pid, plans, duration))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    return _summarize(samples, wall, peaks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare threaded and ASGI serving modes.')
+    parser.add_argument('--service', choices=sorted(ROUTES), default='case')
+    parser.add_argument('--modes', nargs='*', choices=sorted(SERVER), default=['threaded', 'asgi'])
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', default='serving_results.json')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='itdiag-serving-')
+    database_uri = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    upload_folder = os.path.join(workdir, 'uploads')
+    services = load_services(database_uri, upload_folder)
+    logging.getLogger().setLevel(logging.WARNING)
+    ctx = issue_tokens(services, seed_database(services['auth_service'].app, args.scale, args.seed))
+    ctx['admin_auth'] = {'Authorization': f"Bearer {ctx['admin_token']}"}
+
+    rng = random.Random(args.seed)
+    routes = ROUTES[args.service]
+    weights = [w for _, w, _ in routes]
+    plans = []
+    for _ in range(args.clients):
+        plan = []
+        for route, _, build in rng.choices(routes, weights=weights, k=20):
+            plan.append((route,) + build(ctx, rng))
+        plans.append(plan)
+
+    env = dict(os.environ, DATABASE_URI=database_uri, UPLOAD_FOLDER=upload_folder,
+               PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get('PYTHONPATH')])))
+    results = {
+        'meta': {'service': args.service, 'clients': args.clients, 'duration': args.duration,
+                 'scale': args.scale, 'seed': args.seed},
+        'modes': {},
+    }
+    for mode in args.modes:
+        results['modes'][mode] = run_mode(mode, args.service, env, args.port, plans, args.duration)
+        summary = results['modes'][mode]
+        print(f"{mode:9} {summary['requests_per_second']:>9} req/s  failed {summary['failed']:>6}  "
+              f"threads {summary['peak_server_threads']:>5}  fds {summary['peak_server_open_fds']:>5}",
+              file=sys.stderr)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
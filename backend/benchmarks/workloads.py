@@ -0,0 +1,149 @@
+import io
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.harness import reset_query_count, query_count, reset_peak_rss, window_peak_rss_kb
+from benchmarks.seed import BENCHMARK_PASSWORD, build_report, report_size_for
+
+
+class Workload:
+    """A named stream of requests against one service.
+
+    `weight` scales the run's request budget; expensive routes get fewer calls
+    so a run finishes in a reasonable time.
+    """
+
+    def __init__(self, name, service, weight, build):
+        self.name = name
+        self.service = service
+        self.weight = weight
+        self.build = build
+
+
+def _auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def _login(ctx, rng):
+    user = rng.randrange(len(ctx['users']))
+    return 'post', '/auth/login', {'json': {'username': f'user{user:05d}', 'password': BENCHMARK_PASSWORD}}
+
+
+def _list_cases(ctx, rng):
+    user_id = rng.choice(ctx['users'])
+    return 'get', '/case/cases', {'headers': _auth(ctx['tokens'][user_id])}
+
+
+def _get_case(ctx, rng):
+    case_id, owner_id = rng.choice(ctx['cases'])
+    return 'get', f'/case/cases/{case_id}', {'headers': _auth(ctx['tokens'][owner_id])}
+
+
+def _list_comments(ctx, rng):
+    case_id, owner_id = rng.choice(ctx['cases'])
+    return 'get', f'/case/cases/{case_id}/comments', {'headers': _auth(ctx['tokens'][owner_id])}
+
+
+def _admin_cases(ctx, rng):
+    return 'get', '/case/admin/cases', {'headers': _auth(ctx['admin_token'])}
+
+
+def _upload(ctx, rng):
+    case_id, owner_id = rng.choice(ctx['cases'])
+    body = json.dumps(build_report(rng, report_size_for(rng.randrange(20)))).encode()
+    return 'post', f'/diagnostic/upload/{case_id}', {
+        'headers': _auth(ctx['tokens'][owner_id]),
+        'data': {'file': (io.BytesIO(body), 'results.json')},
+        'content_type': 'multipart/form-data',
+    }
+
+
+def _download_script(ctx, rng):
+    case_id, owner_id = rng.choice(ctx['cases'])
+    return 'get', f'/diagnostic/download_script/{case_id}', {'headers': _auth(ctx['tokens'][owner_id])}
+
+
+WORKLOADS = [
+    Workload('login', 'auth_service', 0.25, _login),
+    Workload('list_cases', 'case_service', 1.0, _list_cases),
+    Workload('get_case', 'case_service', 1.0, _get_case),
+    Workload('list_comments', 'case_service', 1.0, _list_comments),
+    Workload('admin_cases', 'case_service', 0.02, _admin_cases),
+    Workload('upload', 'diagnostic_service', 0.25, _upload),
+    Workload('download_script', 'diagnostic_service', 1.0, _download_script),
+]
+
+
+def issue_tokens(services, seeded):
+    auth_app = services['auth_service'].app
+    with auth_app.app_context():
+        tokens = {user_id: create_access_token(identity=user_id, additional_claims={'is_admin': False})
+                  for user_id in seeded['users']}
+        admin_token = create_access_token(identity=seeded['admin_id'], additional_claims={'is_admin': True})
+    return dict(seeded, tokens=tokens, admin_token=admin_token)
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile; stable for the small sample sizes used here
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _timed_request(client, method, path, kwargs):
+    reset_query_count()
+    start = time.perf_counter()
+    response = getattr(client, method)(path, **kwargs)
+    elapsed = time.perf_counter() - start
+    return elapsed, query_count(), response.status_code
+
+
+def run_workload(workload, services, ctx, requests, seed, concurrency=1):
+    """Run one workload and return its summary statistics."""
+    app = services[workload.service].app
+    rng = random.Random(f'{seed}:{workload.name}')
+    # Build the whole plan up front so every run issues the same requests
+    plan = [workload.build(ctx, rng) for _ in range(max(1, int(requests * workload.weight)))]
+
+    measure_rss = reset_peak_rss()
+    if concurrency > 1:
+        clients = [app.test_client() for _ in range(concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda args: _timed_request(clients[args[0] % concurrency], *args[1]),
+                                    enumerate(plan)))
+        wall = time.perf_counter() - start
+    else:
+        client = app.test_client()
+        start = time.perf_counter()
+        samples = [_timed_request(client, *step) for step in plan]
+        wall = time.perf_counter() - start
+
+    latencies = sorted(s[0] * 1000.0 for s in samples)
+    queries = [s[1] for s in samples]
+    errors = sum(1 for s in samples if s[2] >= 400)
+    return {
+        'service': workload.service,
+        'requests': len(samples),
+        'errors': errors,
+        'wall_seconds': round(wall, 4),
+        'throughput_rps': round(len(samples) / wall, 2) if wall else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        },
+        # Peak of this workload alone; None where it can't be measured
+        'peak_rss_kb': window_peak_rss_kb() if measure_rss else None,
+    }
@@ -2,6 +2,8 @@ from flask import Flask, request, jsonify
 from flask_migrate import Migrate
 from common.models import db, Case, User, CaseComment
 from common.config import Config
+from common.profiling import Profiling
+from common.admission import AdmissionControl
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, get_jwt
 from flask_cors import CORS
 from prometheus_flask_exporter import PrometheusMetrics
@@ -18,6 +20,8 @@ CORS(app, resources={r"/*": {"origins": "*", "supports_credentials": True}})
 
 db.init_app(app)
 jwt = JWTManager(app)
+profiling = Profiling(app, url_prefix='/case')
+admission = AdmissionControl(app)
 migrate = Migrate(app, db)
 
 metrics = PrometheusMetrics(app)
@@ -98,6 +102,7 @@ def get_case(case_id):
 
 @app.route('/case/admin/cases', methods=['GET'])
 @jwt_required()
+@admission.limit('admin_cases', rate=6, per=60, by=('user',), concurrency=2)
 def admin_all_cases():
     try:
         claims = get_jwt()
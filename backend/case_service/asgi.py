@@ -0,0 +1,12 @@
+"""Async serving mode for the case service.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5001 --backlog 4096
+
+`python app.py` keeps serving with the threaded development server.
+"""
+from app import app
+from common.asgi import BoundedAsgiApp
+
+# The admin listing dumps the whole cases table; cap it so it can never hold
+# every database connection while regular users wait.
+application = BoundedAsgiApp(app, limits={('GET', '/case/admin/cases'): 2}, default_limit=10)
@@ -0,0 +1,275 @@
+import logging
+import math
+import threading
+import time
+import uuid
+from functools import wraps
+
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# Seconds to wait for Redis before letting a request through
+REDIS_TIMEOUT = 0.25
+
+
+class MemoryBackend:
+    """Token buckets and concurrency slots kept in this process only."""
+
+    SWEEP_EVERY = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def consume(self, key, rate, burst, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+            tokens, last, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return (True, 0.0) if allowed else (False, (cost - tokens) / rate)
+
+    def _sweep(self, now):
+        # Forget buckets that have refilled; a missing bucket starts out full
+        for key, (_, _, full_at) in list(self._buckets.items()):
+            if full_at <= now:
+                del self._buckets[key]
+
+    def acquire(self, key, limit, ttl):
+        with self._lock:
+            if self._slots.get(key, 0) >= limit:
+                return None
+            self._slots[key] = self._slots.get(key, 0) + 1
+            return key
+
+    def release(self, key, token):
+        with self._lock:
+            self._slots[key] -= 1
+
+
+class RedisBackend:
+    """Token buckets and concurrency slots shared through Redis.
+
+    All services and workers pointing at the same Redis share their limits.
+    Both operations are single Lua scripts, so they are atomic, and they use
+    the Redis clock so hosts with skewed clocks agree.
+    """
+
+    CONSUME = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local last = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+        local allowed, retry = 0, 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        else
+            retry = (cost - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+        return {allowed, tostring(retry)}
+    """
+
+    # Slots are members of a sorted set scored by when they were taken, so a
+    # slot held by a worker that died is reclaimed after `ttl` seconds.
+    ACQUIRE = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local limit, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+        if redis.call('ZCARD', KEYS[1]) >= limit then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], now, ARGV[3])
+        redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+        return 1
+    """
+
+    def __init__(self, client, prefix='admission:'):
+        self.client = client
+        self.prefix = prefix
+        self._consume = client.register_script(self.CONSUME)
+        self._acquire = client.register_script(self.ACQUIRE)
+
+    def consume(self, key, rate, burst, cost=1):
+        allowed, retry = self._consume(keys=[self.prefix + key], args=[rate, burst, cost])
+        return bool(allowed), float(retry)
+
+    def acquire(self, key, limit, ttl):
+        token = uuid.uuid4().hex
+        if self._acquire(keys=[self.prefix + key], args=[limit, ttl, token]):
+            return token
+        return None
+
+    def release(self, key, token):
+        self.client.zrem(self.prefix + key, token)
+
+
+def backend_from_uri(uri):
+    if not uri or uri == 'memory':
+        return MemoryBackend()
+    if uri.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise RuntimeError('ADMISSION_BACKEND points at Redis but the redis package is not installed.')
+        # Every limited request waits on Redis, so an unresponsive server must
+        # fail fast rather than hold requests for the default of no timeout
+        return RedisBackend(redis.Redis.from_url(uri, socket_connect_timeout=REDIS_TIMEOUT,
+                                                 socket_timeout=REDIS_TIMEOUT))
+    raise ValueError(f'Unsupported ADMISSION_BACKEND: {uri}')
+
+
+def client_ip():
+    return request.remote_addr
+
+
+def current_user():
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        # Route is not behind @jwt_required()
+        return None
+    return None if identity is None else str(identity)
+
+
+def json_field(name):
+    """Key requests by a field of the JSON body, e.g. `('username', json_field('username'))`."""
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+        return None if value is None else str(value)
+    return key
+
+
+def request_size():
+    # None when the size isn't known up front (chunked uploads)
+    return request.content_length
+
+
+KEY_FUNCTIONS = {'ip': client_ip, 'user': current_user}
+
+
+class AdmissionControl:
+    """Rate limits and concurrency caps for individual routes.
+
+    Routes opt in with the `limit` decorator, placed below `@jwt_required()`
+    when limiting per user:
+
+        @app.route('/case/admin/cases')
+        @jwt_required()
+        @admission.limit('admin_cases', rate=6, per=60, by=('user',), concurrency=2)
+
+    Limits are enforced by the backend named in ADMISSION_BACKEND: `memory`
+    (per process, the default) or a `redis://` URL shared by every service.
+    If the backend is unreachable, requests are let through and the error is
+    logged; the backend is then left alone for BACKEND_RETRY_AFTER seconds
+    so every request doesn't wait out a timeout of its own.
+    ADMISSION_ENABLED=false switches all limits off.
+
+    Behind a load balancer or ingress every request comes from the proxy's
+    address, so all clients would share one per-IP bucket. Set
+    TRUSTED_PROXY_HOPS to the number of proxies in front of the service
+    (1 for the Kubernetes ingress) to key on the client address they pass on
+    in X-Forwarded-For. Leave it at 0 when clients connect directly, since
+    the header could otherwise be forged to dodge the limits.
+    """
+
+    BACKEND_RETRY_AFTER = 5.0
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.enabled = True
+        self._backend_down_until = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = str(app.config.get('ADMISSION_ENABLED', 'true')).lower() not in ('0', 'false', 'no')
+        self.backend = backend_from_uri(app.config.get('ADMISSION_BACKEND'))
+        hops = int(app.config.get('TRUSTED_PROXY_HOPS') or 0)
+        if hops:
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops)
+
+    def limit(self, name, rate=None, per=60, burst=None, by=('ip',), cost=None, concurrency=None, slot_ttl=300):
+        """Limit a route.
+
+        `rate` units per `per` seconds are allowed for every key produced by
+        `by`: 'ip', 'user' or `(kind, function)` pairs, each with a bucket of
+        its own. Bursts go up to `burst` (default `rate`). Each request costs
+        one unit, or `cost()` units; a request costing more than `burst` can
+        never be admitted and gets a 413, and one whose cost is unknown
+        (`cost()` returns None) is charged `burst`. `concurrency` caps how
+        many requests of this route run at once.
+        """
+        key_functions = [(k, KEY_FUNCTIONS[k]) if isinstance(k, str) else k for k in by]
+        burst = burst or rate
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                if rate:
+                    units = cost() if cost else 1
+                    if units is None:
+                        units = burst
+                    elif units > burst:
+                        return jsonify({'message': 'Request too large.'}), 413
+                    for kind, key_function in key_functions:
+                        key = key_function()
+                        if key is None:
+                            continue
+                        allowed, retry_after = self._call(self.backend.consume, (True, 0.0),
+                                                          f'rate:{name}:{kind}:{key}', rate / per, burst, units)
+                        if not allowed:
+                            response = jsonify({'message': 'Too many requests, try again later.'})
+                            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                            return response, 429
+
+                if not concurrency:
+                    return view(*args, **kwargs)
+                slot_key = f'slots:{name}'
+                token = self._call(self.backend.acquire, True, slot_key, concurrency, slot_ttl)
+                if token is None:
+                    response = jsonify({'message': 'Server busy, try again later.'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 503
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    if token is not True:
+                        self._call(self.backend.release, None, slot_key, token)
+            return wrapper
+        return decorator
+
+    def _call(self, operation, fallback, *args):
+        # Fail open: an unavailable backend must not take the service down
+        if time.monotonic() < self._backend_down_until:
+            return fallback
+        try:
+            return operation(*args)
+        except Exception as e:
+            self._backend_down_until = time.monotonic() + self.BACKEND_RETRY_AFTER
+            logging.warning(f"Admission control backend error, letting requests through for "
+                            f"{self.BACKEND_RETRY_AFTER:g}s: {e}")
+            return fallback
@@ -0,0 +1,258 @@
+import json
+import logging
+
+# Bump a section's version whenever its rule changes. Cases analysed with an
+# older version are picked up again by the re-analysis (see reanalysis.py),
+# which only recomputes the sections that changed.
+RULE_VERSIONS = {
+    'ping_test': 1,
+    'dns_resolution': 1,
+    'tracepath': 1,
+    'network_connections': 1,
+    'pending_updates': 1,
+    'swap_usage': 1,
+    'vpn_status': 1,
+    'cpu_usage': 1,
+    'memory_usage': 1,
+    'load_average': 1,
+}
+
+# Sections whose rule also reads the outcome of another section's rule
+RULE_DEPENDENCIES = {
+    'dns_resolution': ('ping_test',),
+}
+
+# Bump by one whenever RULE_VERSIONS changes in any way, including when a
+# section is added or removed. Cases recorded with a lower number are stale,
+# so it must never go down; tests/test_analysis.py pins each value to the
+# RULE_VERSIONS it stands for.
+RULESET_VERSION = 1
+
+ANALYSIS_WITH_SUGGESTIONS = "Analysis completed. See suggestions below if any."
+ANALYSIS_HEALTHY = "No significant issues detected. System appears healthy."
+
+
+def _packet_loss(data):
+    packet_loss = 0
+    for line in data.get('ping_test', []):
+        if "packet loss" in line:
+            parts = line.split(",")
+            if len(parts) >= 3:
+                loss_str = parts[2].strip()
+                loss_percentage = loss_str.split()[0].replace('%', '')
+                try:
+                    packet_loss = float(loss_percentage)
+                except ValueError:
+                    pass
+            break
+    return packet_loss
+
+
+def _check_ping_test(data):
+    packet_loss = _packet_loss(data)
+    if packet_loss > 0:
+        severity = "moderate"
+        if packet_loss > 50:
+            severity = "high"
+        return [
+            f"Ping Test: This test checks connectivity and packet loss to a known host. {severity.capitalize()} packet loss detected.",
+            "Check physical network connections and ensure interfaces are up.",
+            "Verify default gateway and routing configuration.",
+            "Consider traceroute/tracepath to identify where packets are lost.",
+            "Review firewall rules that might drop ICMP.",
+            "Investigate network congestion or bandwidth issues."
+        ]
+
+
+def _check_dns_resolution(data):
+    dns_failure = any("can't resolve" in line.lower() or "server can't find" in line.lower()
+                      for line in data.get('dns_resolution', []))
+    if dns_failure:
+        suggestions = [
+            "DNS Resolution: This test checks if the system can resolve domain names.",
+            "Verify /etc/resolv.conf and DNS server configurations.",
+            "Try alternative DNS servers (e.g., 8.8.8.8) to isolate the issue.",
+            "Check firewall rules that may block DNS queries.",
+            "Use `dig` or `host` for detailed DNS diagnostics.",
+            "Confirm the domain's existence and spelling."
+        ]
+        if _packet_loss(data) == 100:
+            suggestions.append(
+                "If pinging by IP works but domains fail, focus on DNS configuration."
+            )
+        return suggestions
+
+
+def _check_tracepath(data):
+    tracepath_failure = any("unreachable" in line.lower() or "failed" in line.lower()
+                            for line in data.get('tracepath', []))
+    if tracepath_failure:
+        return [
+            "Tracepath: This test examines the route packets take to a remote host.",
+            "Identify the hop where tracepath fails and check that segment.",
+            "Verify gateway and routing configurations.",
+            "Examine firewalls or ACLs that may block traceroute packets.",
+            "Ensure the target host is online and not blocking probes.",
+            "Try MTR or traceroute with different protocols for more insight."
+        ]
+
+
+def _check_network_connections(data):
+    network_connections = data.get('network_connections', [])
+    if network_connections and any("tcp" in line and not (":22 " in line or ":80 " in line or ":443 " in line)
+                                   for line in network_connections):
+        return [
+            "Network Connections: This test lists open ports and connections on the system.",
+            "Review services running on non-standard ports to ensure they're authorized.",
+            "Implement firewall rules to restrict unnecessary open ports.",
+            "Monitor traffic on unusual ports for potential intrusions.",
+            "Document all expected services/ports for a known baseline."
+        ]
+
+
+def _check_pending_updates(data):
+    pending_updates = data.get('pending_updates', [])
+    if pending_updates and len(pending_updates) > 1:
+        return [
+            "Pending Updates: The system has available updates.",
+            "Apply system updates (e.g., `apt-get update && apt-get upgrade`) for security/stability.",
+            "Schedule regular updates to maintain system reliability.",
+            "Review changelogs before applying critical updates.",
+            "Consider unattended upgrades for automatic security updates."
+        ]
+
+
+def _check_swap_usage(data):
+    swap_usage = data.get('swap_usage', [])
+    if swap_usage and len(swap_usage) > 0:
+        parts = swap_usage[0].split()
+        if len(parts) >= 3:
+            try:
+                used_swap = int(parts[2])
+            except ValueError:
+                return None
+            if used_swap > 0:
+                return [
+                    "Swap Usage: This test checks if the system is using swap memory.",
+                    "Identify memory-intensive processes and consider adding more RAM.",
+                    "Reduce swappiness to rely less on swap.",
+                    "Optimize applications or services to reduce memory usage.",
+                    "Consider faster storage for swap or increasing RAM for a long-term fix."
+                ]
+
+
+def _check_vpn_status(data):
+    if 'vpn_status' in data and not data['vpn_status']:
+        return [
+            "VPN Status: This test checks if a VPN service is active (if expected).",
+            "Ensure VPN services (e.g., OpenVPN) are running.",
+            "Check firewall rules for VPN protocols.",
+            "Verify VPN configuration files and credentials."
+        ]
+
+
+def _check_cpu_usage(data):
+    if data.get('cpu_usage', []):
+        return [
+            "CPU Usage: This test checks CPU load distribution (user, system, idle, etc.).",
+            "If CPU usage is high, identify top-consuming processes (`ps aux --sort=-%cpu`).",
+            "Optimize application code or consider load balancing.",
+            "Add more CPU resources or scale out if consistently high."
+        ]
+
+
+def _check_memory_usage(data):
+    if data.get('memory_usage', []):
+        return [
+            "Memory Usage: This test checks how RAM is utilized.",
+            "If usage is high, find memory-intensive processes (`ps aux --sort=-%mem`).",
+            "Add more RAM or optimize applications.",
+            "Monitor memory usage over time with Prometheus/Grafana."
+        ]
+
+
+def _check_load_average(data):
+    if data.get('load_average', []):
+        return [
+            "Load Average: This test provides the average system load over time.",
+            "If load is persistently high, check for CPU/I/O bottlenecks.",
+            "Distribute workloads or scale out.",
+            "Investigate queued processes that drive up load."
+        ]
+
+
+# Evaluated in this order, which is also the order suggestions are shown in
+RULES = {
+    'ping_test': _check_ping_test,
+    'dns_resolution': _check_dns_resolution,
+    'tracepath': _check_tracepath,
+    'network_connections': _check_network_connections,
+    'pending_updates': _check_pending_updates,
+    'swap_usage': _check_swap_usage,
+    'vpn_status': _check_vpn_status,
+    'cpu_usage': _check_cpu_usage,
+    'memory_usage': _check_memory_usage,
+    'load_average': _check_load_average,
+}
+
+
+def analyze_data(data, sections=None):
+    """Run the rules for `sections` (all of them by default) on a parsed report."""
+    suggestions = {}
+    for section, check in RULES.items():
+        if sections is not None and section not in sections:
+            continue
+        result = check(data)
+        if result:
+            suggestions[section] = result
+    return suggestions
+
+
+def summarize(suggestions):
+    return ANALYSIS_WITH_SUGGESTIONS if suggestions else ANALYSIS_HEALTHY
+
+
+def stale_sections(stored_versions, current_versions=RULE_VERSIONS):
+    stored_versions = stored_versions or {}
+    stale = {section for section, version in current_versions.items() if stored_versions.get(section, 0) < version}
+    for section, dependencies in RULE_DEPENDENCIES.items():
+        if stale.intersection(dependencies):
+            stale.add(section)
+    return stale
+
+
+def reanalyze(analysis_data, suggestions, stored_versions, current_versions=RULE_VERSIONS):
+    """Recompute only the sections whose rules changed since the case was analysed.
+
+    Returns the new `(analysis, suggestions)`, or None if nothing is stale.
+    """
+    stale = stale_sections(stored_versions, current_versions)
+    kept = suggestions if isinstance(suggestions, dict) else {}
+    # Suggestions of sections whose rule has been removed are dropped too
+    if not stale and set(kept) <= set(RULES):
+        return None
+    fresh = analyze_data(analysis_data, stale)
+    merged = {}
+    for section in RULES:
+        if section in stale:
+            if section in fresh:
+                merged[section] = fresh[section]
+        elif section in kept:
+            merged[section] = kept[section]
+    return summarize(merged), merged
+
+
+def analyze_results(file_path):
+    try:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+
+        suggestions = analyze_data(data)
+        return summarize(suggestions), data, suggestions
+
+    except json.JSONDecodeError as e:
+        logging.error(f"Invalid JSON in {file_path}: {e}")
+        raise
+    except Exception as e:
+        logging.error(f"Error analyzing results: {e}")
+        raise
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+
+class BoundedAsgiApp:
+    """Serve a Flask (WSGI) app from a single asyncio event loop.
+
+    Open connections and request bodies are handled by the event loop, so
+    thousands of idle or slow clients cost a coroutine each plus their
+    buffered body. A request only gets a worker thread (and with it a
+    database connection) once its body has been fully received and its
+    route has a free slot. Bodies are kept in memory up to
+    `max_body_in_memory` each and `max_buffered` across all requests
+    together; past either they spill to a temporary file, written from the
+    default executor so the disk never blocks the event loop. Bodies over
+    `max_body_size` are refused with a 413 before any of the app runs.
+
+    `limits` maps `(method, path_prefix)` to the number of requests of that
+    route that may run at once; everything else shares `default_limit`.
+    Requests that wait longer than `queue_timeout` seconds for a slot get a
+    503. The thread pool is sized to the sum of all limits, so a saturated
+    route can never take threads away from the others. Keep that sum within
+    the SQLAlchemy pool size (5 + 10 overflow by default). `on_shutdown`
+    callables run when the server shuts down, after in-flight requests.
+    """
+
+    def __init__(self, wsgi_app, limits=None, default_limit=8, queue_timeout=30.0, max_body_in_memory=1024 * 1024,
+                 max_body_size=16 * 1024 * 1024, max_buffered=64 * 1024 * 1024, on_shutdown=()):
+        self.wsgi_app = wsgi_app
+        self.limits = sorted((limits or {}).items(), key=lambda item: len(item[0][1]), reverse=True)
+        self.default_limit = default_limit
+        self.queue_timeout = queue_timeout
+        self.max_body_in_memory = max_body_in_memory
+        self.max_body_size = max_body_size
+        self.max_buffered = max_buffered
+        # Body bytes currently held in memory; only touched from the event loop
+        self.buffered = 0
+        self.on_shutdown = list(on_shutdown)
+        self.executor = ThreadPoolExecutor(max_workers=default_limit + sum(n for _, n in self.limits),
+                                           thread_name_prefix='wsgi')
+        self._semaphores = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                for callback in self.on_shutdown:
+                    callback()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _semaphore_for(self, method, path):
+        # Created lazily so they belong to the running event loop
+        if self._semaphores is None:
+            self._semaphores = {key: asyncio.Semaphore(n) for key, n in self.limits}
+            self._semaphores[None] = asyncio.Semaphore(self.default_limit)
+        for (limit_method, prefix), _ in self.limits:
+            if path.startswith(prefix) and limit_method in (None, method):
+                return self._semaphores[(limit_method, prefix)]
+        return self._semaphores[None]
+
+    async def _read_body(self, scope, receive, send):
+        """The request body as `(file, bytes held in memory)`.
+
+        None if the client left or the body was too large. The caller must
+        give the in-memory bytes back to `buffered` once done with the body.
+        """
+        for name, value in scope.get('headers', []):
+            if name == b'content-length' and value.isdigit() and int(value) > self.max_body_size:
+                await self._too_large(send)
+                return None
+
+        loop = asyncio.get_running_loop()
+        body = SpooledTemporaryFile(max_size=self.max_body_in_memory)
+        size = 0
+        in_memory = 0
+        on_disk = False
+        complete = False
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return None
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > self.max_body_size:
+                    await self._too_large(send)
+                    return None
+                if not on_disk and (size > self.max_body_in_memory or
+                                    self.buffered + len(chunk) > self.max_buffered):
+                    await loop.run_in_executor(None, body.rollover)
+                    self.buffered -= in_memory
+                    in_memory = 0
+                    on_disk = True
+                if on_disk:
+                    await loop.run_in_executor(None, body.write, chunk)
+                else:
+                    body.write(chunk)
+                    in_memory += len(chunk)
+                    self.buffered += len(chunk)
+                if not message.get('more_body'):
+                    break
+            complete = True
+        finally:
+            if not complete:
+                body.close()
+                self.buffered -= in_memory
+        body.seek(0)
+        return body, in_memory
+
+    async def _http(self, scope, receive, send):
+        read = await self._read_body(scope, receive, send)
+        if read is None:
+            return
+        body, in_memory = read
+        try:
+            semaphore = self._semaphore_for(scope['method'], scope['path'])
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                await self._send(send, 503, [(b'content-type', b'application/json')],
+                                 json.dumps({'message': 'Server busy, try again later.'}).encode())
+                return
+            try:
+                loop = asyncio.get_running_loop()
+                status, headers, content = await loop.run_in_executor(
+                    self.executor, self._run_wsgi, self._environ(scope, body))
+            finally:
+                semaphore.release()
+        finally:
+            body.close()
+            self.buffered -= in_memory
+
+        await self._send(send, status, [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+                         content)
+
+    async def _too_large(self, send):
+        await self._send(send, 413, [(b'content-type', b'application/json')],
+                         json.dumps({'message': 'Request body too large.'}).encode())
+
+    @staticmethod
+    async def _send(send, status, headers, content):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def _run_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            # The body has been read in full, so it can be read to EOF even
+            # without a Content-Length (chunked requests)
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-type':
+                key = 'CONTENT_TYPE'
+            elif name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
@@ -30,3 +30,11 @@ class CaseComment(db.Model):
     comment = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, server_default=db.func.now())
     user = db.relationship('User', lazy=True)
+
+# Kept in its own table rather than as columns on `cases` so existing
+# databases pick it up through db.create_all().
+class CaseAnalysisState(db.Model):
+    __tablename__ = 'case_analysis_state'
+    case_id = db.Column(db.Integer, db.ForeignKey('cases.id'), primary_key=True)
+    ruleset_version = db.Column(db.Integer, nullable=False, index=True)
+    rule_versions = db.Column(db.JSON, nullable=False)
@@ -0,0 +1,293 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from flask import Blueprint, Response, g, has_request_context, jsonify, request
+from flask_jwt_extended import get_jwt, jwt_required, verify_jwt_in_request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+MODES = ('sample', 'cprofile')
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread and aggregates it in collapsed format.
+
+    The output (`frame;frame;frame count` per line) can be fed directly to
+    flamegraph.pl or opened in speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+class Profiling:
+    """On-demand request profiling and a rolling slow-request log.
+
+    Everything is off by default. An admin can either switch profiling on for
+    a share of all requests through `<url_prefix>/admin/profiling`, or profile
+    a single request by sending `X-Profile: sample` or `X-Profile: cprofile`
+    with an admin token. While nothing is switched on, the only per-request
+    cost is one header lookup.
+
+    Admin endpoints, all under the service prefix (`/auth`, `/case`, ...):
+
+        GET/POST   /admin/profiling                 settings, e.g. {"enabled": true, "slow_ms": 500}
+        GET/DELETE /admin/profiling/slow            slow requests with their SQL and timings
+        GET        /admin/profiling/profiles        recent profiles
+        GET        /admin/profiling/profiles/<id>   collapsed stacks (sample) or pstats text (cprofile)
+
+    State is kept per process, so with several workers each one has to be
+    switched on (and read back) separately.
+    """
+
+    def __init__(self, app=None, url_prefix=''):
+        self.enabled = False
+        self.mode = 'sample'
+        self.sample_rate = 1.0
+        self.interval = 0.005
+        self.slow_ms = None
+        self.profiles = deque(maxlen=50)
+        self.slow_requests = deque(maxlen=100)
+        self._ids = itertools.count(1)
+        self._sql_hooked = False
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, url_prefix)
+
+    def init_app(self, app, url_prefix=''):
+        slow_ms = app.config.get('PROFILING_SLOW_MS')
+        if slow_ms:
+            self.configure(slow_ms=float(slow_ms))
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.register_blueprint(self._blueprint(), url_prefix=url_prefix)
+
+    def configure(self, enabled=None, mode=None, sample_rate=None, interval=None, slow_ms=None):
+        # Validate everything first so a bad setting leaves the config untouched
+        if enabled is not None and not isinstance(enabled, bool):
+            raise ValueError('enabled must be true or false')
+        if mode is not None and mode not in MODES:
+            raise ValueError(f'mode must be one of {", ".join(MODES)}')
+        for name, value in (('sample_rate', sample_rate), ('interval', interval), ('slow_ms', slow_ms)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+                raise ValueError(f'{name} must be a non-negative number')
+
+        if mode is not None:
+            self.mode = mode
+        if sample_rate is not None:
+            self.sample_rate = min(float(sample_rate), 1.0)
+        if interval is not None:
+            self.interval = max(float(interval), 0.001)
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_ms is not None:
+            # A slow threshold of 0 switches the slow-request log off
+            self.slow_ms = float(slow_ms) or None
+        self._hook_sql()
+
+    @property
+    def active(self):
+        return self.enabled or self.slow_ms is not None
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'mode': self.mode,
+            'sample_rate': self.sample_rate,
+            'interval': self.interval,
+            'slow_ms': self.slow_ms,
+            'profiles': len(self.profiles),
+            'slow_requests': len(self.slow_requests),
+        }
+
+    # SQL capture is only attached while something is switched on or a
+    # profiled request is running; `delta` counts those requests in and out.
+    def _hook_sql(self, delta=0):
+        with self._lock:
+            self._in_flight += delta
+            on = self.active or self._in_flight > 0
+            if on and not self._sql_hooked:
+                event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            elif not on and self._sql_hooked:
+                event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._sql_hooked = on
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiling_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('profiling_start')
+        if not starts:
+            # The hook was attached while this statement was already running
+            return
+        started = starts.pop()
+        queries = getattr(g, 'profiling_queries', None) if has_request_context() else None
+        if queries is not None:
+            queries.append({'statement': statement, 'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+    def _requested_mode(self):
+        mode = request.headers.get(PROFILE_HEADER)
+        if mode:
+            if mode not in MODES:
+                return None
+            # Only admins may profile on demand
+            try:
+                verify_jwt_in_request(optional=True)
+            except Exception:
+                return None
+            return mode if get_jwt().get('is_admin', False) else None
+        if self.enabled and (self.sample_rate >= 1.0 or random.random() < self.sample_rate):
+            return self.mode
+        return None
+
+    def _before_request(self):
+        if not (self.active or PROFILE_HEADER in request.headers):
+            return
+        mode = self._requested_mode()
+        if mode is None and self.slow_ms is None:
+            return
+
+        g.profiling_start = time.perf_counter()
+        g.profiling_mode = mode
+        g.profiling_queries = []
+        self._hook_sql(1)
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiling_profiler = profiler
+            except ValueError:
+                # Another profiler is already active in this thread
+                g.profiling_mode = None
+        elif mode == 'sample':
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+            g.profiling_profiler = sampler
+
+    def _after_request(self, response):
+        if 'profiling_start' in g:
+            g.profiling_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        if 'profiling_start' not in g:
+            return
+        elapsed_ms = (time.perf_counter() - g.profiling_start) * 1000
+        queries = g.pop('profiling_queries', [])
+        profiler = g.pop('profiling_profiler', None)
+        entry = {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': g.get('profiling_status', 500),
+            'duration_ms': round(elapsed_ms, 3),
+            'sql_ms': round(sum(q['ms'] for q in queries), 3),
+            'queries': queries,
+            'timestamp': time.time(),
+        }
+
+        if profiler is not None:
+            if isinstance(profiler, StackSampler):
+                output = profiler.stop()
+            else:
+                profiler.disable()
+                buffer = io.StringIO()
+                pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(50)
+                output = buffer.getvalue()
+            self.profiles.append(dict(entry, id=next(self._ids), mode=g.profiling_mode, output=output))
+
+        if self.slow_ms is not None and elapsed_ms >= self.slow_ms:
+            self.slow_requests.append(entry)
+        # Drops the SQL hooks again once the last one-off X-Profile request is done
+        self._hook_sql(-1)
+
+    def _blueprint(self):
+        bp = Blueprint('profiling', __name__)
+
+        def admin_only():
+            if not get_jwt().get('is_admin', False):
+                return jsonify({'message': 'Admin only.'}), 403
+            return None
+
+        @bp.route('/admin/profiling', methods=['GET', 'POST'])
+        @jwt_required()
+        def profiling_settings():
+            denied = admin_only()
+            if denied:
+                return denied
+            if request.method == 'POST':
+                data = request.get_json() or {}
+                try:
+                    self.configure(**data)
+                except TypeError:
+                    return jsonify({'message': 'Unknown profiling setting.'}), 400
+                except ValueError as e:
+                    return jsonify({'message': str(e)}), 400
+            return jsonify(self.status()), 200
+
+        @bp.route('/admin/profiling/slow', methods=['GET', 'DELETE'])
+        @jwt_required()
+        def profiling_slow_requests():
+            denied = admin_only()
+            if denied:
+                return denied
+            if request.method == 'DELETE':
+                self.slow_requests.clear()
+            return jsonify(list(reversed(self.slow_requests))), 200
+
+        @bp.route('/admin/profiling/profiles', methods=['GET'])
+        @jwt_required()
+        def profiling_profiles():
+            denied = admin_only()
+            if denied:
+                return denied
+            return jsonify([{k: v for k, v in p.items() if k not in ('output', 'queries')}
+                            for p in reversed(self.profiles)]), 200
+
+        @bp.route('/admin/profiling/profiles/<int:profile_id>', methods=['GET'])
+        @jwt_required()
+        def profiling_profile(profile_id):
+            denied = admin_only()
+            if denied:
+                return denied
+            for p in self.profiles:
+                if p['id'] == profile_id:
+                    if request.args.get('format') == 'json':
+                        return jsonify(p), 200
+                    return Response(p['output'], mimetype='text/plain')
+            return jsonify({'message': 'Profile not found.'}), 404
+
+        return bp
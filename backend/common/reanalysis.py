@@ -0,0 +1,165 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+
+from common.analysis import RULE_VERSIONS, RULESET_VERSION, reanalyze
+from common.models import db, Case, CaseAnalysisState
+
+
+def _reanalyze_row(row):
+    case_id, analysis, analysis_data, suggestions, stored_versions, current_versions = row
+    result = reanalyze(analysis_data, suggestions, stored_versions, current_versions)
+    # Only hand back cases whose stored results actually change
+    if result == (analysis, suggestions):
+        return case_id, None
+    return case_id, result
+
+
+# Postgres deadlock_detected and serialization_failure
+RETRYABLE_PGCODES = ('40P01', '40001')
+CHUNK_RETRIES = 5
+
+
+def _retryable(error):
+    if getattr(error.orig, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    # SQLite gives up on a lock held by another writer after its busy timeout
+    return 'database is locked' in str(error.orig)
+
+
+def _insert_state():
+    # Plain INSERT has no portable way to handle an existing row
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(CaseAnalysisState)
+    if dialect == 'sqlite':
+        return sqlite.insert(CaseAnalysisState)
+    raise NotImplementedError(f'Analysis state upserts are not implemented for {dialect}')
+
+
+def record_analysis_state(case_id, ruleset_version=RULESET_VERSION, rule_versions=None):
+    """Insert or overwrite the rule versions a case was just analysed with."""
+    rule_versions = dict(rule_versions or RULE_VERSIONS)
+    insert = _insert_state().values(case_id=case_id, ruleset_version=ruleset_version, rule_versions=rule_versions)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=[CaseAnalysisState.case_id],
+        set_={'ruleset_version': ruleset_version, 'rule_versions': rule_versions}))
+
+
+def _claim(rows, ruleset_version, rule_versions):
+    """Move the state of `rows` to `ruleset_version` unless it changed since they were read.
+
+    Returns the ids of the cases claimed. A case is lost if an upload (or
+    another re-analysis) recorded a new state in the meantime; its freshly
+    stored results must not be overwritten with ones computed from old data.
+    """
+    claimed = set()
+    by_version = {}
+    for row in rows:
+        by_version.setdefault(row.ruleset_version, []).append(row.id)
+
+    for read_version, case_ids in by_version.items():
+        if read_version is None:
+            insert = _insert_state().on_conflict_do_nothing(index_elements=[CaseAnalysisState.case_id])
+            result = db.session.execute(insert.returning(CaseAnalysisState.case_id), [
+                {'case_id': case_id, 'ruleset_version': ruleset_version, 'rule_versions': rule_versions}
+                for case_id in case_ids])
+        else:
+            result = db.session.execute(
+                update(CaseAnalysisState)
+                .where(CaseAnalysisState.case_id.in_(case_ids))
+                .where(CaseAnalysisState.ruleset_version == read_version)
+                .values(ruleset_version=ruleset_version, rule_versions=rule_versions)
+                .returning(CaseAnalysisState.case_id))
+        claimed.update(case_id for case_id, in result)
+    return claimed
+
+
+def stale_cases_query(ruleset_version, after_id=0):
+    """Cases with a stored report whose rule versions are older than `ruleset_version`."""
+    return (db.session.query(Case.id, Case.analysis, Case.analysis_data, Case.suggestions,
+                             CaseAnalysisState.rule_versions, CaseAnalysisState.ruleset_version)
+            .outerjoin(CaseAnalysisState, CaseAnalysisState.case_id == Case.id)
+            .filter(Case.analysis_data.isnot(None))
+            .filter(or_(CaseAnalysisState.case_id.is_(None), CaseAnalysisState.ruleset_version < ruleset_version))
+            .filter(Case.id > after_id)
+            .order_by(Case.id))
+
+
+def reanalyze_cases(chunk_size=500, workers=0, limit=None, progress=None, rule_versions=None, ruleset_version=None):
+    """Bring every stored case up to the current rule versions.
+
+    Cases are processed in ascending id order, `chunk_size` at a time, and
+    each chunk is committed on its own. Finished cases no longer match the
+    stale query, so an interrupted run simply picks up where it stopped.
+    With `workers` > 0 the rules run in a process pool.
+
+    A case is only written if its analysis state is still the one that was
+    read, so uploads that land mid-chunk and concurrent runs are left alone
+    (counted as `skipped`). A chunk that hits a deadlock or serialization
+    failure is rolled back and read again, up to CHUNK_RETRIES times.
+
+    Must be called inside an app context. `progress`, if given, is updated
+    in place so another thread can report on a running job.
+    """
+    rule_versions = dict(rule_versions or RULE_VERSIONS)
+    ruleset_version = ruleset_version or RULESET_VERSION
+    progress = progress if progress is not None else {}
+    progress.update(ruleset_version=ruleset_version, scanned=0, updated=0, skipped=0, last_case_id=0,
+                    started_at=time.time(), finished_at=None)
+
+    pool = None
+    if workers:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    retries = 0
+    try:
+        while limit is None or progress['scanned'] < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - progress['scanned'])
+            rows = stale_cases_query(ruleset_version, progress['last_case_id']).limit(size).all()
+            if not rows:
+                break
+
+            work = [tuple(row)[:5] + (rule_versions,) for row in rows]
+            if pool is not None:
+                results = pool.map(_reanalyze_row, work, chunksize=max(1, len(work) // (workers * 4)))
+            else:
+                results = map(_reanalyze_row, work)
+            results = list(results)
+
+            try:
+                # State rows before cases, the same lock order as uploads
+                claimed = _claim(rows, ruleset_version, rule_versions)
+                case_updates = []
+                for case_id, result in results:
+                    if result is not None and case_id in claimed:
+                        analysis, suggestions = result
+                        case_updates.append({'id': case_id, 'analysis': analysis, 'suggestions': suggestions})
+                db.session.bulk_update_mappings(Case, case_updates)
+                db.session.commit()
+            except DBAPIError as e:
+                db.session.rollback()
+                if not _retryable(e) or retries >= CHUNK_RETRIES:
+                    raise
+                retries += 1
+                logging.warning(f"Re-analysis: retrying chunk after case {progress['last_case_id']} "
+                                f"({retries}/{CHUNK_RETRIES}): {e.orig}")
+                time.sleep(0.1 * retries)
+                continue
+            retries = 0
+
+            progress['scanned'] += len(rows)
+            progress['updated'] += len(case_updates)
+            progress['skipped'] += len(rows) - len(claimed)
+            progress['last_case_id'] = rows[-1].id
+            logging.info(f"Re-analysis: {progress['scanned']} cases scanned, {progress['updated']} updated, "
+                         f"{progress['skipped']} skipped, up to case {progress['last_case_id']}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        progress['finished_at'] = time.time()
+    return progress
@@ -1,16 +1,25 @@
 import os
+import atexit
 import logging
-import json
 import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
+import click
 from flask import Flask, request, jsonify, make_response
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token, get_jwt
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from tenacity import retry, stop_after_attempt, wait_fixed
 from prometheus_flask_exporter import PrometheusMetrics
 from common.models import db, Case, User
 from common.config import Config
+from common.analysis import analyze_results, RULESET_VERSION
+from common.reanalysis import reanalyze_cases, record_analysis_state
+from common.profiling import Profiling
+from common.admission import AdmissionControl, request_size
 from scripts.generate_diagnostic_script import generate_diagnostic_script
 
 logging.basicConfig(level=logging.DEBUG)
@@ -18,12 +27,18 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 app.config.from_object(Config)
 app.config['JWT_SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your_secret_key')
-app.config['UPLOAD_FOLDER'] = '/app/uploads'
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
+# Larger results files are refused outright (413), whatever the upload budget
+app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
+# Number of processes for analyze_results; 0 runs the analysis in the request thread
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', '0'))
 
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 db.init_app(app)
 jwt = JWTManager(app)
+profiling = Profiling(app, url_prefix='/diagnostic')
+admission = AdmissionControl(app)
 migrate = Migrate(app, db)
 
 metrics = PrometheusMetrics(app)
@@ -38,175 +53,38 @@ def initialize_database():
 
 initialize_database()
 
-def analyze_results(file_path):
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-
-        suggestions = {}
-        analysis_data = data
-
-        ping_results = data.get('ping_test', [])
-        dns_results = data.get('dns_resolution', [])
-        tracepath_results = data.get('tracepath', [])
-        pending_updates = data.get('pending_updates', [])
-        swap_usage = data.get('swap_usage', [])
-        network_connections = data.get('network_connections', [])
-        cpu_usage = data.get('cpu_usage', [])
-        memory_usage = data.get('memory_usage', [])
-        load_average = data.get('load_average', [])
-        vpn_status = data.get('vpn_status', [])
-
-        # Default analysis message
-        analysis = "Analysis completed. See suggestions below if any."
-
-        # Ping Test
-        packet_loss = 0
-        ping_issue = False
-        for line in ping_results:
-            if "packet loss" in line:
-                parts = line.split(",")
-                if len(parts) >= 3:
-                    loss_str = parts[2].strip()
-                    loss_percentage = loss_str.split()[0].replace('%', '')
-                    try:
-                        packet_loss = float(loss_percentage)
-                        if packet_loss > 0:
-                            ping_issue = True
-                    except ValueError:
-                        pass
-                break
-
-        if ping_issue:
-            severity = "moderate"
-            if packet_loss > 50:
-                severity = "high"
-            suggestions['ping_test'] = [
-                f"Ping Test: This test checks connectivity and packet loss to a known host. {severity.capitalize()} packet loss detected.",
-                "Check physical network connections and ensure interfaces are up.",
-                "Verify default gateway and routing configuration.",
-                "Consider traceroute/tracepath to identify where packets are lost.",
-                "Review firewall rules that might drop ICMP.",
-                "Investigate network congestion or bandwidth issues."
-            ]
-
-        # DNS Resolution
-        dns_failure = any("can't resolve" in line.lower() or "server can't find" in line.lower() for line in dns_results)
-        if dns_failure:
-            suggestions['dns_resolution'] = [
-                "DNS Resolution: This test checks if the system can resolve domain names.",
-                "Verify /etc/resolv.conf and DNS server configurations.",
-                "Try alternative DNS servers (e.g., 8.8.8.8) to isolate the issue.",
-                "Check firewall rules that may block DNS queries.",
-                "Use `dig` or `host` for detailed DNS diagnostics.",
-                "Confirm the domain's existence and spelling."
-            ]
-            if ping_issue and packet_loss == 100:
-                suggestions['dns_resolution'].append(
-                    "If pinging by IP works but domains fail, focus on DNS configuration."
-                )
-
-        # Tracepath
-        tracepath_failure = any("unreachable" in line.lower() or "failed" in line.lower() for line in tracepath_results)
-        if tracepath_failure:
-            suggestions['tracepath'] = [
-                "Tracepath: This test examines the route packets take to a remote host.",
-                "Identify the hop where tracepath fails and check that segment.",
-                "Verify gateway and routing configurations.",
-                "Examine firewalls or ACLs that may block traceroute packets.",
-                "Ensure the target host is online and not blocking probes.",
-                "Try MTR or traceroute with different protocols for more insight."
-            ]
-
-        # Network Connections
-        if network_connections and any("tcp" in line and not (":22 " in line or ":80 " in line or ":443 " in line)
-                                       for line in network_connections):
-            suggestions['network_connections'] = [
-                "Network Connections: This test lists open ports and connections on the system.",
-                "Review services running on non-standard ports to ensure they're authorized.",
-                "Implement firewall rules to restrict unnecessary open ports.",
-                "Monitor traffic on unusual ports for potential intrusions.",
-                "Document all expected services/ports for a known baseline."
-            ]
-
-        # Pending Updates
-        if pending_updates and len(pending_updates) > 1:
-            suggestions['pending_updates'] = [
-                "Pending Updates: The system has available updates.",
-                "Apply system updates (e.g., `apt-get update && apt-get upgrade`) for security/stability.",
-                "Schedule regular updates to maintain system reliability.",
-                "Review changelogs before applying critical updates.",
-                "Consider unattended upgrades for automatic security updates."
-            ]
-
-        # Swap Usage
-        if swap_usage and len(swap_usage) > 0:
-            parts = swap_usage[0].split()
-            if len(parts) >= 3:
-                try:
-                    used_swap = int(parts[2])
-                    if used_swap > 0:
-                        suggestions['swap_usage'] = [
-                            "Swap Usage: This test checks if the system is using swap memory.",
-                            "Identify memory-intensive processes and consider adding more RAM.",
-                            "Reduce swappiness to rely less on swap.",
-                            "Optimize applications or services to reduce memory usage.",
-                            "Consider faster storage for swap or increasing RAM for a long-term fix."
-                        ]
-                except ValueError:
-                    pass
-
-        # VPN Status
-        if 'vpn_status' in data and not data['vpn_status']:
-            suggestions['vpn_status'] = [
-                "VPN Status: This test checks if a VPN service is active (if expected).",
-                "Ensure VPN services (e.g., OpenVPN) are running.",
-                "Check firewall rules for VPN protocols.",
-                "Verify VPN configuration files and credentials."
-            ]
-
-        # CPU Usage
-        if cpu_usage:
-            suggestions['cpu_usage'] = [
-                "CPU Usage: This test checks CPU load distribution (user, system, idle, etc.).",
-                "If CPU usage is high, identify top-consuming processes (`ps aux --sort=-%cpu`).",
-                "Optimize application code or consider load balancing.",
-                "Add more CPU resources or scale out if consistently high."
-            ]
-
-        # Memory Usage
-        if memory_usage:
-            suggestions['memory_usage'] = [
-                "Memory Usage: This test checks how RAM is utilized.",
-                "If usage is high, find memory-intensive processes (`ps aux --sort=-%mem`).",
-                "Add more RAM or optimize applications.",
-                "Monitor memory usage over time with Prometheus/Grafana."
-            ]
-
-        # Load Average
-        if load_average:
-            suggestions['load_average'] = [
-                "Load Average: This test provides the average system load over time.",
-                "If load is persistently high, check for CPU/I/O bottlenecks.",
-                "Distribute workloads or scale out.",
-                "Investigate queued processes that drive up load."
-            ]
-
-        # If no suggestions at all
-        if not suggestions:
-            analysis = "No significant issues detected. System appears healthy."
-
-        return analysis, analysis_data, suggestions
-
-    except json.JSONDecodeError as e:
-        logging.error(f"Invalid JSON in {file_path}: {e}")
-        raise
-    except Exception as e:
-        logging.error(f"Error analyzing results: {e}")
-        raise
+analysis_pool = None
+analysis_pool_lock = threading.Lock()
+
+def run_analysis(file_path):
+    # Analysis is CPU-bound; a process pool keeps it from holding the GIL
+    # while other requests are being served.
+    global analysis_pool
+    if not app.config['ANALYSIS_WORKERS']:
+        return analyze_results(file_path)
+    with analysis_pool_lock:
+        if analysis_pool is None:
+            # Spawned rather than forked so workers don't inherit the server's sockets
+            analysis_pool = ProcessPoolExecutor(max_workers=app.config['ANALYSIS_WORKERS'],
+                                                mp_context=multiprocessing.get_context('spawn'))
+        pool = analysis_pool
+    return pool.submit(analyze_results, file_path).result()
+
+@atexit.register
+def shutdown_analysis_pool():
+    global analysis_pool
+    with analysis_pool_lock:
+        pool, analysis_pool = analysis_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
 
 @app.route('/diagnostic/upload/<int:case_id>', methods=['POST'])
 @jwt_required()
+@admission.limit('upload', rate=10, per=60, by=('user', 'ip'), concurrency=4)
+# Uploads are also charged by size: 50 MB per hour, up to 20 MB at once.
+# Chunked uploads of unknown size are charged the full 20 MB.
+@admission.limit('upload_bytes', rate=50 * 1024 * 1024, per=3600, burst=app.config['MAX_CONTENT_LENGTH'],
+                 by=('user',), cost=request_size)
 def upload_results(case_id):
     try:
         user_id = get_jwt_identity()
@@ -227,16 +105,23 @@ def upload_results(case_id):
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
 
-        analysis, analysis_data, suggestions = analyze_results(file_path)
+        analysis, analysis_data, suggestions = run_analysis(file_path)
         if not isinstance(suggestions, dict):
             suggestions = {}
 
+        # Write the state row first, before touching the case: re-analysis
+        # locks the two rows in that order too, so they can't deadlock. It's
+        # an upsert, as a running re-analysis may create the row at the same time.
+        record_analysis_state(case_id)
         case.analysis = analysis
         case.analysis_data = analysis_data
         case.suggestions = suggestions
         db.session.commit()
 
         return jsonify({'message': 'File uploaded and analysis completed.'}), 200
+    except RequestEntityTooLarge:
+        # Over MAX_CONTENT_LENGTH, found while reading a body of unknown size
+        return jsonify({'message': 'Request too large.'}), 413
     except Exception as e:
         app.logger.error(f"Exception in /upload/{case_id}: {e}")
         return jsonify({'message': 'Internal server error'}), 500
@@ -271,6 +156,62 @@ def download_script(case_id):
         app.logger.error(f"Exception in /download_script/{case_id}: {str(e)}")
         return jsonify({'message': 'Internal server error'}), 500
         
+reanalysis_progress = {}
+MAX_REANALYSIS_CHUNK = 10000
+reanalysis_thread = None
+reanalysis_lock = threading.Lock()
+
+def run_reanalysis(chunk_size, workers):
+    with app.app_context():
+        try:
+            reanalyze_cases(chunk_size=chunk_size, workers=workers, progress=reanalysis_progress)
+        except Exception as e:
+            app.logger.error(f"Exception in re-analysis: {e}")
+            reanalysis_progress['error'] = str(e)
+
+@app.route('/diagnostic/admin/reanalyze', methods=['GET', 'POST'])
+@jwt_required()
+def admin_reanalyze():
+    global reanalysis_thread
+    try:
+        claims = get_jwt()
+        if not claims.get("is_admin", False):
+            return jsonify({'message': 'Admin only.'}), 403
+
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            chunk_size = data.get('chunk_size', 500)
+            workers = data.get('workers', app.config['ANALYSIS_WORKERS'])
+            max_workers = max(os.cpu_count() or 1, app.config['ANALYSIS_WORKERS'])
+            if type(chunk_size) is not int or not 1 <= chunk_size <= MAX_REANALYSIS_CHUNK:
+                return jsonify({'message': f'chunk_size must be an integer from 1 to {MAX_REANALYSIS_CHUNK}.'}), 400
+            if type(workers) is not int or not 0 <= workers <= max_workers:
+                return jsonify({'message': f'workers must be an integer from 0 to {max_workers}.'}), 400
+            with reanalysis_lock:
+                if reanalysis_thread is not None and reanalysis_thread.is_alive():
+                    return jsonify({'message': 'Re-analysis already running.', **reanalysis_progress}), 409
+                reanalysis_progress.clear()
+                reanalysis_thread = threading.Thread(target=run_reanalysis, args=(chunk_size, workers), daemon=True)
+                reanalysis_thread.start()
+            return jsonify({'message': 'Re-analysis started.', 'ruleset_version': RULESET_VERSION}), 202
+
+        running = reanalysis_thread is not None and reanalysis_thread.is_alive()
+        return jsonify({'running': running, **reanalysis_progress}), 200
+    except Exception as e:
+        app.logger.error(f"Exception in /admin/reanalyze: {e}")
+        return jsonify({'message': 'Internal server error'}), 500
+
+@app.cli.command('reanalyze')
+@click.option('--chunk-size', default=500, type=click.IntRange(1, MAX_REANALYSIS_CHUNK), help='Cases loaded and committed per batch.')
+@click.option('--workers', default=os.cpu_count() or 1, type=click.IntRange(0), help='Analysis processes; 0 runs in this process.')
+@click.option('--limit', type=int, default=None, help='Stop after this many cases.')
+def reanalyze_command(chunk_size, workers, limit):
+    """Re-run the analysis rules on cases analysed with older rule versions."""
+    logging.getLogger().setLevel(logging.INFO)
+    progress = reanalyze_cases(chunk_size=chunk_size, workers=workers, limit=limit)
+    click.echo(f"Scanned {progress['scanned']} cases, updated {progress['updated']} "
+               f"(rule set version {progress['ruleset_version']}).")
+
 @app.route('/metrics')
 def metrics():
     return metrics.generate_latest(), 200        
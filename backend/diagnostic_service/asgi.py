@@ -0,0 +1,18 @@
+"""Async serving mode for the diagnostic service.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5002 --backlog 4096
+
+`python app.py` keeps serving with the threaded development server.
+"""
+import os
+
+# Run analyze_results in a process pool unless configured otherwise
+os.environ.setdefault('ANALYSIS_WORKERS', str(os.cpu_count() or 1))
+
+from app import app, shutdown_analysis_pool
+from common.asgi import BoundedAsgiApp
+
+# Uploads write to disk and run the analysis; cap them so script downloads
+# keep getting served while a batch of results comes in.
+application = BoundedAsgiApp(app, limits={('POST', '/diagnostic/upload/'): 4}, default_limit=8,
+                             max_body_size=app.config['MAX_CONTENT_LENGTH'], on_shutdown=[shutdown_analysis_pool])
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The services import `common.*` with backend/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
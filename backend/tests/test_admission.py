@@ -0,0 +1,155 @@
+import time
+
+import fakeredis
+import pytest
+from flask import Flask, jsonify, request
+
+from common.admission import REDIS_TIMEOUT, AdmissionControl, MemoryBackend, RedisBackend, backend_from_uri
+
+
+def _header(name):
+    def key():
+        return request.headers.get(name)
+    return key
+
+
+def _declared_cost():
+    value = request.headers.get('X-Cost')
+    return None if value is None else int(value)
+
+
+class BrokenBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def _fail(self, *args):
+        self.calls += 1
+        raise ConnectionError('Redis went away')
+
+    consume = acquire = release = _fail
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def backend(request):
+    if request.param == 'memory':
+        return MemoryBackend()
+    return RedisBackend(fakeredis.FakeRedis(server=fakeredis.FakeServer()))
+
+
+@pytest.fixture
+def admission(backend):
+    admission = AdmissionControl()
+    admission.backend = backend
+    return admission
+
+
+@pytest.fixture
+def client(admission):
+    app = Flask(__name__)
+
+    @app.route('/fast')
+    @admission.limit('fast', rate=20, per=1, burst=2)
+    def fast():
+        return jsonify({'message': 'ok'})
+
+    @app.route('/slow')
+    @admission.limit('slow', rate=1, per=10)
+    def slow():
+        return jsonify({'message': 'ok'})
+
+    @app.route('/sized', methods=['POST'])
+    @admission.limit('sized', rate=1, per=3600, burst=100, cost=_declared_cost)
+    def sized():
+        return jsonify({'message': 'ok'})
+
+    @app.route('/keyed')
+    @admission.limit('keyed', rate=1, per=3600, by=(('a', _header('X-Key')), ('b', _header('X-Key'))))
+    def keyed():
+        return jsonify({'message': 'ok'})
+
+    @app.route('/keyed_too')
+    @admission.limit('keyed_too', rate=1, per=3600, by=(('a', _header('X-Key')),))
+    def keyed_too():
+        return jsonify({'message': 'ok'})
+
+    @app.route('/single')
+    @admission.limit('single', concurrency=1)
+    def single():
+        if request.args.get('fail'):
+            raise RuntimeError('view failed')
+        return jsonify({'message': 'ok'})
+
+    return app.test_client()
+
+
+def test_tokens_refill(client):
+    assert [client.get('/fast').status_code for _ in range(3)] == [200, 200, 429]
+    time.sleep(0.1)
+    assert client.get('/fast').status_code == 200
+
+
+def test_retry_after_is_when_a_token_is_back(client):
+    assert client.get('/slow').status_code == 200
+    response = client.get('/slow')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '10'
+
+
+def test_cost_over_burst_is_refused_without_charging(client):
+    assert client.post('/sized', headers={'X-Cost': '101'}).status_code == 413
+    assert client.post('/sized', headers={'X-Cost': '100'}).status_code == 200
+
+
+def test_unknown_cost_is_charged_the_whole_burst(client):
+    assert client.post('/sized').status_code == 200
+    assert client.post('/sized', headers={'X-Cost': '1'}).status_code == 429
+
+
+def test_buckets_are_separate_per_route_and_kind(client):
+    # Both kinds and both routes see the same key, and each gets a bucket of its own
+    assert client.get('/keyed', headers={'X-Key': 'k'}).status_code == 200
+    assert client.get('/keyed_too', headers={'X-Key': 'k'}).status_code == 200
+    assert client.get('/keyed', headers={'X-Key': 'other'}).status_code == 200
+    assert client.get('/keyed', headers={'X-Key': 'k'}).status_code == 429
+
+
+def test_requests_without_a_key_are_not_limited(client):
+    assert [client.get('/keyed').status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_slot_is_released_when_the_view_raises(client):
+    client.application.testing = False
+    assert client.get('/single?fail=1').status_code == 500
+    assert client.get('/single').status_code == 200
+
+
+def test_concurrency_cap(backend):
+    held = backend.acquire('slots:single', 1, 300)
+    assert held is not None
+    assert backend.acquire('slots:single', 1, 300) is None
+    backend.release('slots:single', held)
+    assert backend.acquire('slots:single', 1, 300) is not None
+
+
+def test_fails_open_and_backs_off(client, admission, monkeypatch):
+    broken = BrokenBackend()
+    admission.backend = broken
+    assert client.get('/slow').status_code == 200
+    assert client.get('/single').status_code == 200
+    # The backend isn't asked again until the back-off runs out
+    assert broken.calls == 1
+
+    monkeypatch.setattr(admission, '_backend_down_until', time.monotonic() - 1)
+    assert client.get('/slow').status_code == 200
+    assert broken.calls == 2
+
+
+def test_disabled_admission_lets_everything_through(client, admission):
+    admission.enabled = False
+    assert [client.get('/slow').status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_redis_backend_has_short_timeouts():
+    backend = backend_from_uri('redis://localhost:6379/0')
+    connection_kwargs = backend.client.connection_pool.connection_kwargs
+    assert connection_kwargs['socket_connect_timeout'] == connection_kwargs['socket_timeout'] == REDIS_TIMEOUT
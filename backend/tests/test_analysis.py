@@ -0,0 +1,167 @@
+import hashlib
+import json
+
+import pytest
+
+from common.analysis import (ANALYSIS_HEALTHY, ANALYSIS_WITH_SUGGESTIONS, RULE_VERSIONS, RULES, RULESET_VERSION,
+                             analyze_data, analyze_results, reanalyze, stale_sections, summarize)
+
+# RULESET_VERSION -> digest of the RULE_VERSIONS it was released with. When
+# bumping a rule's version, bump RULESET_VERSION and add its digest here.
+RULESET_DIGESTS = {
+    1: '6da60c34247a38976ef3b2aca785a7007738b58641b20ab3549c964533edd032',
+}
+
+HEALTHY = {
+    'ping_test': ['64 bytes from 142.250.0.1: icmp_seq=1 ttl=117 time=12.3 ms',
+                  '4 packets transmitted, 4 received, 0% packet loss, time 3004ms'],
+    'dns_resolution': ['Server:\t\t127.0.0.53', 'Name:\tgoogle.com', 'Address: 142.250.0.1'],
+    'tracepath': [' 1:  10.0.1.1  1.234ms'],
+    'network_connections': ['tcp   LISTEN 0      128    0.0.0.0:22 0.0.0.0:*',
+                            'tcp   LISTEN 0      128    0.0.0.0:443 0.0.0.0:*'],
+    'pending_updates': ['Listing...'],
+    'swap_usage': ['Swap: 2047 0 2047'],
+    'vpn_status': ['openvpn.service active (running)'],
+}
+
+# (section, report changes, expected first line of that section's suggestions or None)
+SECTION_CASES = [
+    ('ping_test', {'ping_test': ['4 packets transmitted, 3 received, 25% packet loss, time 3004ms']},
+     'Ping Test: This test checks connectivity and packet loss to a known host. Moderate packet loss detected.'),
+    ('ping_test', {'ping_test': ['4 packets transmitted, 2 received, 50% packet loss, time 3004ms']},
+     'Ping Test: This test checks connectivity and packet loss to a known host. Moderate packet loss detected.'),
+    ('ping_test', {'ping_test': ['4 packets transmitted, 1 received, 51% packet loss, time 3004ms']},
+     'Ping Test: This test checks connectivity and packet loss to a known host. High packet loss detected.'),
+    ('ping_test', {'ping_test': ['4 packets transmitted, 0 received, n/a% packet loss']}, None),
+    ('ping_test', {'ping_test': ['packet loss']}, None),
+    ('dns_resolution', {'dns_resolution': ["** server can't find example.com: NXDOMAIN"]},
+     'DNS Resolution: This test checks if the system can resolve domain names.'),
+    ('dns_resolution', {'dns_resolution': ["Can't resolve example.com"]},
+     'DNS Resolution: This test checks if the system can resolve domain names.'),
+    ('tracepath', {'tracepath': ['Too many hops: pmtu 1500 unreachable']},
+     'Tracepath: This test examines the route packets take to a remote host.'),
+    ('tracepath', {'tracepath': ['resolve FAILED']},
+     'Tracepath: This test examines the route packets take to a remote host.'),
+    ('network_connections', {'network_connections': ['tcp   LISTEN 0      128    0.0.0.0:8080 0.0.0.0:*']},
+     'Network Connections: This test lists open ports and connections on the system.'),
+    ('network_connections', {'network_connections': ['udp   UNCONN 0      0      0.0.0.0:53 0.0.0.0:*']}, None),
+    ('pending_updates', {'pending_updates': ['Listing...', 'openssl/stable 3.0.1 amd64 [upgradable]']},
+     'Pending Updates: The system has available updates.'),
+    ('swap_usage', {'swap_usage': ['Swap: 2047 512 1535']},
+     'Swap Usage: This test checks if the system is using swap memory.'),
+    ('swap_usage', {'swap_usage': ['Swap: 2047 lots 1535']}, None),
+    ('swap_usage', {'swap_usage': ['Swap:']}, None),
+    ('vpn_status', {'vpn_status': []},
+     'VPN Status: This test checks if a VPN service is active (if expected).'),
+    ('cpu_usage', {'cpu_usage': ['%Cpu(s): 12.0 us, 1.0 sy, 0.0 ni, 87.0 id']},
+     'CPU Usage: This test checks CPU load distribution (user, system, idle, etc.).'),
+    ('memory_usage', {'memory_usage': ['Mem: 7982 5000 1200 12 2300 6400']},
+     'Memory Usage: This test checks how RAM is utilized.'),
+    ('load_average', {'load_average': ['0.52 0.48 0.40 1/523 4242']},
+     'Load Average: This test provides the average system load over time.'),
+]
+
+
+def test_ruleset_version_matches_rule_versions():
+    digest = hashlib.sha256(json.dumps(RULE_VERSIONS, sort_keys=True).encode()).hexdigest()
+    assert RULESET_VERSION == max(RULESET_DIGESTS), 'RULESET_VERSION must be the latest in RULESET_DIGESTS'
+    assert RULESET_DIGESTS[RULESET_VERSION] == digest, \
+        'RULE_VERSIONS changed: bump RULESET_VERSION and record the new digest in RULESET_DIGESTS'
+
+
+def test_every_rule_has_a_version():
+    assert set(RULES) == set(RULE_VERSIONS)
+
+
+def test_healthy_report():
+    assert analyze_data(HEALTHY) == {}
+    assert summarize(analyze_data(HEALTHY)) == ANALYSIS_HEALTHY
+
+
+@pytest.mark.parametrize('section, changes, expected', SECTION_CASES)
+def test_section_rules(section, changes, expected):
+    suggestions = analyze_data(dict(HEALTHY, **changes))
+    assert set(suggestions) == ({section} if expected else set())
+    if expected:
+        assert suggestions[section][0] == expected
+        assert summarize(suggestions) == ANALYSIS_WITH_SUGGESTIONS
+
+
+def test_dns_hint_depends_on_total_packet_loss():
+    dns_failure = {'dns_resolution': ["** server can't find example.com: NXDOMAIN"]}
+    hint = 'If pinging by IP works but domains fail, focus on DNS configuration.'
+    for loss, expect_hint in [(25, False), (99, False), (100, True)]:
+        report = dict(HEALTHY, ping_test=[f'4 packets transmitted, 0 received, {loss}% packet loss'], **dns_failure)
+        assert (hint in analyze_data(report)['dns_resolution']) is expect_hint
+
+
+def test_suggestions_follow_rule_order():
+    report = {'load_average': ['1.0'], 'ping_test': ['4 packets transmitted, 0 received, 100% packet loss'],
+              'vpn_status': []}
+    assert list(analyze_data(report)) == ['ping_test', 'vpn_status', 'load_average']
+
+
+def test_analyze_data_limited_to_sections():
+    report = {'cpu_usage': ['x'], 'memory_usage': ['y']}
+    assert list(analyze_data(report, {'memory_usage'})) == ['memory_usage']
+
+
+def test_analyze_results_reads_the_file(tmp_path):
+    report = dict(HEALTHY, cpu_usage=['%Cpu(s): 12.0 us'])
+    path = tmp_path / 'results.json'
+    path.write_text(json.dumps(report))
+    assert analyze_results(str(path)) == (ANALYSIS_WITH_SUGGESTIONS, report, analyze_data(report))
+
+
+def test_stale_sections_include_dependents():
+    assert stale_sections(RULE_VERSIONS) == set()
+    assert stale_sections({}) == set(RULE_VERSIONS)
+    assert stale_sections(RULE_VERSIONS, dict(RULE_VERSIONS, ping_test=RULE_VERSIONS['ping_test'] + 1)) == \
+        {'ping_test', 'dns_resolution'}
+
+
+def _stricter_network_connections(data):
+    # Flags anything listening, including the standard ports
+    if any('LISTEN' in line for line in data.get('network_connections', [])):
+        return ['Network Connections: every listening port is reported.']
+
+
+def test_reanalyze_rewrites_only_the_changed_rule(monkeypatch):
+    report = dict(HEALTHY, cpu_usage=['%Cpu(s): 12.0 us'])
+    stored = analyze_data(report)
+    # Kept as stored, since its rule didn't change
+    stored['cpu_usage'] = ['Stored by an earlier upload.']
+
+    monkeypatch.setitem(RULES, 'network_connections', _stricter_network_connections)
+    bumped = dict(RULE_VERSIONS, network_connections=RULE_VERSIONS['network_connections'] + 1)
+    analysis, suggestions = reanalyze(report, stored, RULE_VERSIONS, bumped)
+
+    assert suggestions == {'network_connections': ['Network Connections: every listening port is reported.'],
+                           'cpu_usage': ['Stored by an earlier upload.']}
+    assert list(suggestions) == ['network_connections', 'cpu_usage']
+    assert analysis == ANALYSIS_WITH_SUGGESTIONS
+
+
+def test_reanalyze_matches_full_analysis_with_the_new_rule(monkeypatch):
+    report = dict(HEALTHY, vpn_status=[], ping_test=['4 packets transmitted, 0 received, 100% packet loss'])
+    stored = analyze_data(report)
+    monkeypatch.setitem(RULES, 'network_connections', _stricter_network_connections)
+    bumped = dict(RULE_VERSIONS, network_connections=RULE_VERSIONS['network_connections'] + 1)
+    expected = analyze_data(report)
+    assert reanalyze(report, stored, RULE_VERSIONS, bumped) == (summarize(expected), expected)
+
+
+def test_reanalyze_removes_suggestions_the_new_rule_drops():
+    report = dict(HEALTHY)
+    stored = {'network_connections': ['From an older, stricter rule.']}
+    bumped = dict(RULE_VERSIONS, network_connections=RULE_VERSIONS['network_connections'] + 1)
+    assert reanalyze(report, stored, RULE_VERSIONS, bumped) == (ANALYSIS_HEALTHY, {})
+
+
+def test_reanalyze_up_to_date_is_a_no_op():
+    assert reanalyze(HEALTHY, analyze_data(HEALTHY), RULE_VERSIONS, RULE_VERSIONS) is None
+
+
+def test_reanalyze_drops_removed_sections():
+    stored = dict(analyze_data(HEALTHY), retired_rule=['No longer checked.'])
+    assert reanalyze(HEALTHY, stored, RULE_VERSIONS, RULE_VERSIONS) == (ANALYSIS_HEALTHY, {})
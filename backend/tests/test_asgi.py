@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+
+from flask import Flask, jsonify, request
+
+from common.asgi import BoundedAsgiApp
+
+
+def _flask_app(release=None):
+    app = Flask(__name__)
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        return jsonify({'files': sorted(request.files)})
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return jsonify({'size': len(request.get_data())})
+
+    @app.route('/slow', methods=['GET'])
+    def slow():
+        release.wait(5)
+        return jsonify({'message': 'done'})
+
+    return app
+
+
+def _receiver(chunks):
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+    return receive
+
+
+async def _call(app, method, path, chunks=(b'',), headers=()):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': list(headers),
+             'query_string': b'', 'http_version': '1.1', 'scheme': 'http'}
+    await app(scope, _receiver(list(chunks)), send)
+    body = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return sent[0]['status'], json.loads(body)
+
+
+def _multipart(content):
+    boundary = 'testboundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="results.json"\r\n'
+            f'Content-Type: application/json\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, (b'content-type', f'multipart/form-data; boundary={boundary}'.encode())
+
+
+def test_chunked_body_reaches_the_app():
+    app = BoundedAsgiApp(_flask_app())
+    body, content_type = _multipart(b'{"ping_test": []}')
+    chunks = [body[i:i + 16] for i in range(0, len(body), 16)]
+
+    with_length = asyncio.run(_call(app, 'POST', '/upload', [body],
+                                    [content_type, (b'content-length', str(len(body)).encode())]))
+    chunked = asyncio.run(_call(app, 'POST', '/upload', chunks, [content_type]))
+    assert with_length == chunked == (200, {'files': ['file']})
+
+
+def test_declared_length_over_limit_is_refused():
+    app = BoundedAsgiApp(_flask_app(), max_body_size=100)
+    status, _ = asyncio.run(_call(app, 'POST', '/echo', [b'x' * 10], [(b'content-length', b'101')]))
+    assert status == 413
+
+
+def test_streamed_body_over_limit_is_refused():
+    app = BoundedAsgiApp(_flask_app(), max_body_size=100)
+    status, _ = asyncio.run(_call(app, 'POST', '/echo', [b'x' * 60, b'x' * 60]))
+    assert status == 413
+    assert app.buffered == 0
+
+
+def test_request_gives_its_buffer_back():
+    app = BoundedAsgiApp(_flask_app(), max_body_in_memory=100)
+    assert asyncio.run(_call(app, 'POST', '/echo', [b'x' * 50])) == (200, {'size': 50})
+    # Spilled to disk part way through
+    assert asyncio.run(_call(app, 'POST', '/echo', [b'x' * 60, b'x' * 60])) == (200, {'size': 120})
+    assert app.buffered == 0
+
+
+def test_bodies_spill_once_the_shared_buffer_is_full():
+    app = BoundedAsgiApp(_flask_app(), max_body_in_memory=1000, max_buffered=1500)
+
+    async def read_bodies():
+        return [await app._read_body({'headers': []}, _receiver([b'x' * size]), None) for size in (800, 800, 100)]
+
+    held = asyncio.run(read_bodies())
+    # The second body would take the total past 1500, so it goes to disk;
+    # the third still fits in what is left
+    assert [in_memory for _, in_memory in held] == [800, 0, 100]
+    assert app.buffered == 900
+    assert [body.read() for body, _ in held] == [b'x' * 800, b'x' * 800, b'x' * 100]
+    for body, _ in held:
+        body.close()
+
+
+def test_queued_request_times_out_with_503():
+    release = threading.Event()
+    app = BoundedAsgiApp(_flask_app(release), limits={('GET', '/slow'): 1}, queue_timeout=0.2)
+
+    async def run():
+        first = asyncio.ensure_future(_call(app, 'GET', '/slow'))
+        await asyncio.sleep(0.05)
+        second = await _call(app, 'GET', '/slow')
+        release.set()
+        return await first, second
+
+    first, second = asyncio.run(run())
+    assert first[0] == 200
+    assert second[0] == 503
+
+
+def test_longest_matching_prefix_wins():
+    app = BoundedAsgiApp(_flask_app(), default_limit=8,
+                         limits={(None, '/case'): 4, ('GET', '/case/admin/'): 1, ('POST', '/case/admin/cases'): 2})
+
+    async def limits_for(requests):
+        return [app._semaphore_for(method, path)._value for method, path in requests]
+
+    limits = asyncio.run(limits_for([('GET', '/case/admin/cases'), ('POST', '/case/admin/cases'),
+                                     ('PUT', '/case/admin/cases'), ('GET', '/other')]))
+    assert limits == [1, 2, 4, 8]
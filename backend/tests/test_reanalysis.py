@@ -0,0 +1,151 @@
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+import common.reanalysis as reanalysis
+from common.analysis import RULE_VERSIONS, RULES, RULESET_VERSION, analyze_data, summarize
+from common.models import db, Case, CaseAnalysisState, User
+from common.reanalysis import reanalyze_cases, record_analysis_state
+
+REPORTS = [
+    {'network_connections': ['tcp   LISTEN 0      128    0.0.0.0:22 0.0.0.0:*'], 'cpu_usage': ['12.0 us']},
+    {'network_connections': ['tcp   LISTEN 0      128    0.0.0.0:8080 0.0.0.0:*'], 'vpn_status': []},
+    {'ping_test': ['4 packets transmitted, 0 received, 100% packet loss'], 'load_average': ['0.5']},
+]
+BUMPED = dict(RULE_VERSIONS, network_connections=RULE_VERSIONS['network_connections'] + 1)
+
+
+def _stricter_network_connections(data):
+    if any('LISTEN' in line for line in data.get('network_connections', [])):
+        return ['Network Connections: every listening port is reported.']
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='owner', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        for i in range(30):
+            report = REPORTS[i % len(REPORTS)]
+            suggestions = analyze_data(report)
+            db.session.add(Case(description=f'Case {i}', platform='linux', user_id=user.id,
+                                analysis=summarize(suggestions), analysis_data=report, suggestions=suggestions))
+        # Not analysed yet, so never picked up
+        db.session.add(Case(description='No report', platform='linux', user_id=user.id))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def _states():
+    return {s.case_id: s.ruleset_version for s in CaseAnalysisState.query}
+
+
+def test_first_pass_records_state_and_second_does_nothing(app):
+    with app.app_context():
+        first = reanalyze_cases(chunk_size=7)
+        assert (first['scanned'], first['updated'], first['skipped']) == (30, 0, 0)
+        assert set(_states().values()) == {RULESET_VERSION}
+        assert len(_states()) == 30
+
+        second = reanalyze_cases(chunk_size=7)
+        assert (second['scanned'], second['updated']) == (0, 0)
+
+
+def test_resume_after_limit(app):
+    with app.app_context():
+        first = reanalyze_cases(chunk_size=4, limit=10)
+        done = set(_states())
+        assert first['scanned'] == len(done) == 10
+        assert max(done) == first['last_case_id']
+
+        rest = reanalyze_cases(chunk_size=4)
+        assert rest['scanned'] == 20
+        # Picks up after the cases already done
+        assert min(set(_states()) - done) > first['last_case_id']
+        assert len(_states()) == 30
+
+
+def test_stale_sections_are_rewritten(app, monkeypatch):
+    with app.app_context():
+        reanalyze_cases()
+        monkeypatch.setitem(RULES, 'network_connections', _stricter_network_connections)
+        progress = reanalyze_cases(chunk_size=8, rule_versions=BUMPED, ruleset_version=RULESET_VERSION + 1)
+
+        # The two reports with listening ports change, the ping-only one doesn't
+        assert (progress['scanned'], progress['updated']) == (30, 20)
+        for case in Case.query.filter(Case.analysis_data.isnot(None)):
+            assert case.suggestions == analyze_data(case.analysis_data)
+        assert set(_states().values()) == {RULESET_VERSION + 1}
+        assert all(s.rule_versions == BUMPED for s in CaseAnalysisState.query)
+
+
+def test_case_updated_mid_chunk_is_skipped(app, monkeypatch):
+    with app.app_context():
+        reanalyze_cases()
+        monkeypatch.setitem(RULES, 'network_connections', _stricter_network_connections)
+        claim = reanalysis._claim
+        uploaded = []
+
+        def upload_then_claim(rows, *args):
+            # An upload records a newer state after the chunk was read
+            case_id = rows[0].id
+            record_analysis_state(case_id, RULESET_VERSION + 1, BUMPED)
+            db.session.get(Case, case_id).suggestions = {'uploaded': ['Fresh results.']}
+            uploaded.append(case_id)
+            return claim(rows, *args)
+
+        monkeypatch.setattr(reanalysis, '_claim', upload_then_claim)
+        progress = reanalyze_cases(chunk_size=10, rule_versions=BUMPED, ruleset_version=RULESET_VERSION + 1)
+
+        assert progress['skipped'] == len(uploaded) == 3
+        db.session.expire_all()
+        for case_id in uploaded:
+            assert db.session.get(Case, case_id).suggestions == {'uploaded': ['Fresh results.']}
+
+
+def test_cases_without_state_are_claimed_once(app):
+    with app.app_context():
+        record_analysis_state(1)
+        db.session.commit()
+        progress = reanalyze_cases(chunk_size=30)
+        # Case 1 already had current state, so it isn't stale
+        assert progress['scanned'] == 29
+        assert len(_states()) == 30
+
+
+def test_chunk_is_retried_after_a_deadlock(app, monkeypatch):
+    class Deadlock(Exception):
+        pgcode = '40P01'
+
+    claim = reanalysis._claim
+    failures = []
+
+    def deadlock_once(*args):
+        if not failures:
+            failures.append(True)
+            raise OperationalError('UPDATE case_analysis_state ...', {}, Deadlock('deadlock detected'))
+        return claim(*args)
+
+    monkeypatch.setattr(reanalysis, '_claim', deadlock_once)
+    monkeypatch.setattr(reanalysis.time, 'sleep', lambda seconds: None)
+    with app.app_context():
+        progress = reanalyze_cases(chunk_size=10)
+        assert failures == [True]
+        assert (progress['scanned'], progress['skipped']) == (30, 0)
+        assert len(_states()) == 30
+
+
+def test_other_database_errors_are_not_retried(app, monkeypatch):
+    def broken(*args):
+        raise OperationalError('UPDATE case_analysis_state ...', {}, Exception('disk I/O error'))
+
+    monkeypatch.setattr(reanalysis, '_claim', broken)
+    with app.app_context(), pytest.raises(OperationalError):
+        reanalyze_cases(chunk_size=10)